@@ -0,0 +1,198 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+import google.generativeai as genai
+from PIL import Image, ImageOps
+from pymongo import ReturnDocument
+
+PROMPT = """Analyze the given image carefully. Return with exactly four fields:
+1. Type : A short, specific label for the primary subject. Type must be of Cloths, Non-perishable Food, School Supplies, Hygiene Products, Baby Supplies and Books. And if not in these type say Other.
+2. Quantity: How many distinct items are visible? Provide an integer.
+3. Google Image: "Yes" or "No" depending on whether you suspect it is found on Google.
+4. AI Generated: "Yes" or "No" depending on whether you suspect it was AI-generated.
+
+Start with "Here is the analysis of the image:"""
+
+FAKE_RESPONSE = """Here is the analysis of the image:
+1. Type: Books
+2. Quantity: 1
+3. Google Image: No
+4. AI Generated: No"""
+
+
+def prepare_image(image, max_edge=1024, image_format="JPEG", quality=85):
+    """Shrink and re-encode an image for the model, dropping EXIF and other metadata.
+
+    Returns (bytes, mime_type).
+    """
+    # Bake the EXIF orientation into the pixels before the metadata is dropped
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    out = BytesIO()
+    image.save(out, format=image_format, quality=quality)
+    return out.getvalue(), Image.MIME[image_format.upper()]
+
+
+class GeminiBackend:
+    """Gemini client shared by every request; the model object is built once."""
+
+    def __init__(self, api_key, model_name="models/gemini-2.0-flash", timeout=600):
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name=model_name)
+        self.timeout = timeout
+
+    def analyze(self, image_bytes, mime_type):
+        response = self.model.generate_content(
+            [{"mime_type": mime_type, "data": image_bytes}, PROMPT],
+            request_options={"timeout": self.timeout}
+        )
+        return response.text
+
+
+class FakeBackend:
+    """Stand-in model for local runs and load tests; never leaves the process."""
+
+    def __init__(self, latency=0.0, response=FAKE_RESPONSE):
+        self.latency = latency
+        self.response = response
+
+    def analyze(self, image_bytes, mime_type):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.response
+
+
+def create_backend(name=None):
+    name = name or os.getenv("ANALYSIS_BACKEND", "gemini")
+    if name == "fake":
+        return FakeBackend(latency=float(os.getenv("FAKE_MODEL_LATENCY", "0")))
+    if name == "gemini":
+        return GeminiBackend(os.getenv("GEMINI_API_KEY"))
+    raise ValueError(f"Unknown analysis backend: {name}")
+
+
+class QueueFull(Exception):
+    pass
+
+
+# Each process refreshes heartbeat_at on its unfinished jobs this often; a
+# job not refreshed for HEARTBEAT_TIMEOUT belonged to a process that died
+HEARTBEAT_INTERVAL = 5
+HEARTBEAT_TIMEOUT = 30
+LOST_JOB_ERROR = "The server analysing this image stopped; please upload it again"
+
+
+class AnalysisQueue:
+    """Runs image analysis on a bounded thread pool.
+
+    Job state lives in Mongo so any server process can answer a status poll;
+    the image payload itself only lives in the submitting process. That
+    process keeps a heartbeat on its unfinished jobs, and get() reports a
+    job failed once its heartbeat stops, e.g. because the worker was
+    recycled mid-call.
+    """
+
+    def __init__(self, jobs, analyze, workers=4, max_pending=32, retries=2, backoff=1.0,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, heartbeat_timeout=HEARTBEAT_TIMEOUT):
+        self.jobs = jobs
+        self.analyze = analyze
+        self.retries = retries
+        self.backoff = backoff
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analysis")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.active = set()
+        self.active_lock = threading.Lock()
+        threading.Thread(target=self._heartbeat, name="analysis-heartbeat", daemon=True).start()
+
+    def submit(self, image_data):
+        if not self.slots.acquire(blocking=False):
+            raise QueueFull("Too many images are waiting for analysis")
+        job_id = uuid.uuid4().hex
+        now = datetime.utcnow()
+        try:
+            self.jobs.insert_one({
+                "_id": job_id, "status": "queued", "attempts": 0,
+                "created_at": now, "updated_at": now, "heartbeat_at": now
+            })
+            with self.active_lock:
+                self.active.add(job_id)
+            self.executor.submit(self._run, job_id, image_data)
+        except Exception:
+            with self.active_lock:
+                self.active.discard(job_id)
+            self.slots.release()
+            raise
+        return job_id
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self.active_lock:
+                job_ids = list(self.active)
+            if not job_ids:
+                continue
+            try:
+                self.jobs.update_many(
+                    {"_id": {"$in": job_ids}, "status": {"$in": ["queued", "running"]}},
+                    {"$set": {"heartbeat_at": datetime.utcnow()}}
+                )
+            except Exception:
+                # Missing one beat is fine; the timeout covers several
+                pass
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = datetime.utcnow()
+        self.jobs.update_one({"_id": job_id}, {"$set": fields})
+
+    def _run(self, job_id, image_data):
+        try:
+            for attempt in range(1, self.retries + 2):
+                self._update(job_id, status="running", attempts=attempt)
+                try:
+                    result = self.analyze(image_data)
+                except Exception as e:
+                    if attempt > self.retries:
+                        self._update(job_id, status="failed", error=str(e))
+                        return
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+                else:
+                    self._update(job_id, status="done", result=result)
+                    return
+        finally:
+            with self.active_lock:
+                self.active.discard(job_id)
+            self.slots.release()
+
+    def get(self, job_id):
+        job = self.jobs.find_one({"_id": job_id})
+        if job is None or job["status"] not in ("queued", "running"):
+            return job
+        # Jobs created before heartbeats were stored only have updated_at
+        beat = job.get("heartbeat_at") or job["updated_at"]
+        if (datetime.utcnow() - beat).total_seconds() <= self.heartbeat_timeout:
+            return job
+        # Only fail the state we read, in case the worker updated it meanwhile
+        failed = self.jobs.find_one_and_update(
+            {"_id": job_id, "status": job["status"], "updated_at": job["updated_at"]},
+            {"$set": {"status": "failed", "error": LOST_JOB_ERROR, "updated_at": datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+        return failed or self.jobs.find_one({"_id": job_id})
+
+    def wait(self, job_id, timeout, interval=0.25):
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] in ("done", "failed") or time.monotonic() >= deadline:
+                return job
+            time.sleep(interval)
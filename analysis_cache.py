@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+HASH_BITS = 64
+
+
+def dhash(image, size=8):
+    """Difference hash: one bit per horizontally adjacent pixel pair of a tiny greyscale copy."""
+    small = image.convert("L").resize((size + 1, size), Image.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def hash_bands(value, max_distance):
+    """Split a hash into ``max_distance + 1`` labelled bands.
+
+    Two hashes within ``max_distance`` bits of each other must agree on at
+    least one whole band, so exact band lookups find every near-duplicate.
+    """
+    count = max_distance + 1
+    width = HASH_BITS // count
+    bands = []
+    for i in range(count):
+        shift = i * width
+        bits = width if i < count - 1 else HASH_BITS - shift
+        bands.append(f"{i}:{(value >> shift) & ((1 << bits) - 1):x}")
+    return bands
+
+
+class AnalysisCache:
+    """In-process LRU cache of model verdicts with a TTL.
+
+    Entries are keyed by the sha256 of the image bytes; a dHash band index
+    on the side lets recompressed or resized copies hit the same entry.
+    """
+
+    def __init__(self, max_entries=1024, ttl=24 * 60 * 60, max_distance=4):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.entries = OrderedDict()
+        self.bands = {}
+        self.lock = threading.Lock()
+        self.hits = {"exact": 0, "similar": 0}
+        self.misses = 0
+
+    def _expired(self, entry):
+        return time.monotonic() - entry["stored_at"] > self.ttl
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        for band in hash_bands(entry["dhash"], self.max_distance):
+            keys = self.bands.get(band)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self.bands[band]
+
+    def get(self, key, image_hash=None):
+        """Return (result, match) where match is "exact", "similar" or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and self._expired(entry):
+                self._remove(key)
+                entry = None
+            if entry:
+                self.entries.move_to_end(key)
+                self.hits["exact"] += 1
+                return entry["result"], "exact"
+
+            if image_hash is not None:
+                candidates = set()
+                for band in hash_bands(image_hash, self.max_distance):
+                    candidates |= self.bands.get(band, set())
+                best = None
+                for candidate in candidates:
+                    entry = self.entries[candidate]
+                    if self._expired(entry):
+                        continue
+                    distance = hamming(image_hash, entry["dhash"])
+                    if distance <= self.max_distance and (best is None or distance < best[0]):
+                        best = (distance, candidate)
+                if best:
+                    self.entries.move_to_end(best[1])
+                    self.hits["similar"] += 1
+                    return self.entries[best[1]]["result"], "similar"
+
+            self.misses += 1
+            return None, None
+
+    def put(self, key, image_hash, result):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = {"result": result, "dhash": image_hash, "stored_at": time.monotonic()}
+            for band in hash_bands(image_hash, self.max_distance):
+                self.bands.setdefault(band, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+
+
+def find_reused_photo(fingerprints, image_hash, donor_id, max_distance=4):
+    """Return ids of other donors who already submitted a near-identical photo."""
+    candidates = fingerprints.find(
+        {"bands": {"$in": hash_bands(image_hash, max_distance)}, "donor_id": {"$ne": donor_id}},
+        {"donor_id": 1, "dhash": 1}
+    ).limit(100)
+    donor_ids = []
+    for candidate in candidates:
+        if hamming(image_hash, int(candidate["dhash"], 16)) <= max_distance and candidate["donor_id"] not in donor_ids:
+            donor_ids.append(candidate["donor_id"])
+    return donor_ids
+
+
+def record_fingerprint(fingerprints, image_id, image_hash, donor_id, max_distance=4):
+    fingerprints.update_one(
+        {"image_id": image_id, "donor_id": donor_id},
+        {"$setOnInsert": {"dhash": f"{image_hash:016x}", "bands": hash_bands(image_hash, max_distance)}},
+        upsert=True
+    )
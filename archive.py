@@ -0,0 +1,206 @@
+import fcntl
+import gzip
+import hashlib
+import heapq
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from bson import json_util
+from bson.objectid import ObjectId
+
+from pagination import InvalidQuery
+
+DAY_FORMAT = "%Y-%m-%d"
+MAX_RANGE_DAYS = 366
+
+
+class ArchiveBusy(Exception):
+    pass
+
+
+def resolved_day(doc):
+    """Partition for a resolved request: the day it was resolved, or created for old records."""
+    resolved_at = doc.get("resolved_at")
+    if not isinstance(resolved_at, datetime):
+        resolved_at = doc["_id"].generation_time.replace(tzinfo=None)
+    return resolved_at.strftime(DAY_FORMAT)
+
+
+def older_than(cutoff):
+    """Query for resolved requests resolved before ``cutoff``."""
+    return {"$or": [
+        {"resolved_at": {"$lt": cutoff}},
+        # Records from before resolved_at was stored; their _id is the donation's
+        {"resolved_at": {"$exists": False}, "_id": {"$lt": ObjectId.from_datetime(cutoff)}}
+    ]}
+
+
+def matches(doc, query):
+    """Evaluate the equality and $gte/$lt/$lte filters that build_filter() produces."""
+    for field, condition in query.items():
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            if "$gte" in condition and (value is None or value < condition["$gte"]):
+                return False
+            if "$lt" in condition and (value is None or value >= condition["$lt"]):
+                return False
+            if "$lte" in condition and (value is None or value > condition["$lte"]):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class RequestArchive:
+    """Resolved requests moved out of Mongo into gzip'd JSON-lines files.
+
+    Files live under ``<root>/<collection>/<YYYY-MM>/<YYYY-MM-DD>.<first _id>.jsonl.gz``,
+    one or more per day the requests were resolved, and manifest.json lists
+    every file with its day, record count and checksum. Documents are
+    written as extended JSON, so ObjectIds and dates read back unchanged.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, "manifest.json")
+
+    def manifest(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"files": []}
+
+    def _write_atomic(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _write_part(self, name, day, docs):
+        relative = os.path.join(name, day[:7], f"{day}.{docs[0]['_id']}.jsonl.gz")
+        body = "".join(json_util.dumps(doc) + "\n" for doc in docs).encode("utf-8")
+        data = gzip.compress(body)
+        self._write_atomic(os.path.join(self.root, relative), data)
+        return {
+            "collection": name,
+            "day": day,
+            "path": relative,
+            "records": len(docs),
+            "min_id": str(docs[0]["_id"]),
+            "max_id": str(docs[-1]["_id"]),
+            "bytes": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "archived_at": datetime.utcnow().isoformat() + "Z"
+        }
+
+    @contextmanager
+    def _exclusive(self):
+        """Hold the archive's lock file, or raise ArchiveBusy if another run holds it.
+
+        The lock is an flock, so it covers runs in other processes and is
+        released if the run dies.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, ".lock"), "w") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise ArchiveBusy(f"another archive run is using {self.root}")
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _record(self, entries):
+        manifest = self.manifest()
+        paths = {entry["path"] for entry in entries}
+        # A rerun after a crash rewrites the same file names; keep one entry each
+        manifest["files"] = [entry for entry in manifest["files"] if entry["path"] not in paths] + entries
+        manifest["files"].sort(key=lambda entry: (entry["collection"], entry["day"], entry["path"]))
+        self._write_atomic(self.manifest_path, json.dumps(manifest, indent=1).encode("utf-8"))
+
+    def archive(self, collection, cutoff, batch_size=5000):
+        """Move every request in ``collection`` resolved before ``cutoff`` into files.
+
+        Works in batches: write the batch's files, record them in the
+        manifest, then delete exactly those documents. If it stops midway
+        the next run picks up where it left off. Only one run at a time may
+        use the archive; a second raises ArchiveBusy. Returns (records, files).
+        """
+        name = collection.name
+        moved, files = 0, 0
+        with self._exclusive():
+            while True:
+                docs = list(collection.find(older_than(cutoff)).sort("_id", 1).limit(batch_size))
+                if not docs:
+                    return moved, files
+                by_day = {}
+                for doc in docs:
+                    by_day.setdefault(resolved_day(doc), []).append(doc)
+                entries = [self._write_part(name, day, day_docs) for day, day_docs in sorted(by_day.items())]
+                self._record(entries)
+                collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+                moved += len(docs)
+                files += len(entries)
+
+    def records(self, name, start=None, end=None, after=None):
+        """Yield archived documents of ``name`` resolved between the ``YYYY-MM-DD`` bounds.
+
+        With ``after``, files whose ``max_id`` shows every document in them
+        is at or before it are not opened; documents are not filtered.
+        """
+        seen, seen_day = set(), None
+        for entry in self.manifest()["files"]:
+            if entry["collection"] != name:
+                continue
+            if (start and entry["day"] < start) or (end and entry["day"] > end):
+                continue
+            if after is not None and ObjectId(entry["max_id"]) <= after:
+                continue
+            if entry["day"] != seen_day:
+                seen, seen_day = set(), entry["day"]
+            with gzip.open(os.path.join(self.root, entry["path"]), "rt", encoding="utf-8") as f:
+                for line in f:
+                    doc = json_util.loads(line)
+                    # A batch archived twice after an interrupted run appears in two files of the same day
+                    if doc["_id"] in seen:
+                        continue
+                    seen.add(doc["_id"])
+                    yield doc
+
+    def page(self, name, start, end, query, limit, after=None):
+        """One keyset page of archived documents ordered by ``_id``, like fetch_page()."""
+        docs = (
+            doc for doc in self.records(name, start, end, after)
+            if matches(doc, query) and (after is None or doc["_id"] > after)
+        )
+        docs = heapq.nsmallest(limit + 1, docs, key=lambda doc: doc["_id"])
+        next_cursor = None
+        if len(docs) > limit:
+            docs = docs[:limit]
+            next_cursor = str(docs[-1]["_id"])
+        return docs, next_cursor
+
+
+def parse_range(start, end):
+    """Validate the ``YYYY-MM-DD`` range an archived read must ask for."""
+    if not (start and end):
+        raise InvalidQuery("resolved_from and resolved_to are required for archived results")
+    try:
+        first, last = datetime.strptime(start, DAY_FORMAT), datetime.strptime(end, DAY_FORMAT)
+    except ValueError:
+        raise InvalidQuery("resolved_from and resolved_to must be YYYY-MM-DD")
+    if last < first:
+        raise InvalidQuery("resolved_to must not be before resolved_from")
+    if last - first > timedelta(days=MAX_RANGE_DAYS):
+        raise InvalidQuery(f"Archived ranges are limited to {MAX_RANGE_DAYS} days")
+    return start, end
@@ -0,0 +1,358 @@
+"""Benchmark every route against seeded data at one or more scales.
+
+    python -m benchmarks.run --mock --scale 1000 --scale 10000
+    python -m benchmarks.run --mongo-uri mongodb://localhost:27017/bridge_bench --scale 100000 -o after.json --compare before.json
+
+Run from the repository root. ``--mock`` needs ``pip install mongomock``
+and measures the app rather than Mongo; use a local mongod for numbers
+that reflect index and query-plan changes. mongomock has no $text, so
+/donations/search reports 5xx there, and no geo queries, so nothing is
+seeded with a location and /organisationPickup takes its unranked path.
+
+Each scenario runs on its own after a warmup, so throughput is per
+endpoint; --mixed adds a weighted replay of all of them and --traffic
+replays a capture instead (see benchmarks.traffic.load_traffic). Latency
+covers the whole request through Flask's test client; heap usage is
+traced on a few separate requests so tracing does not skew latency.
+"""
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from benchmarks.seed import seed
+from benchmarks.traffic import SCENARIOS, load_traffic, mixed
+
+BENCH_PASSWORD = "bench-password"
+# Latency changes smaller than this are treated as noise by --compare
+NOISE_FLOOR_MS = 1.0
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def _patch_mongomock_bulk():
+    """Let mongomock's bulk_write accept the ``sort`` pymongo 4.11 passes to updates and replaces."""
+    from mongomock.collection import BulkOperationBuilder
+
+    for name in ("add_update", "add_replace"):
+        method = getattr(BulkOperationBuilder, name)
+        if getattr(method, "drops_sort", False):
+            continue
+
+        def patched(self, *args, _method=method, sort=None, **kwargs):
+            return _method(self, *args, **kwargs)
+        patched.drops_sort = True
+        setattr(BulkOperationBuilder, name, patched)
+
+
+def build_app(mongo_uri, mock, model_latency, bcrypt_rounds, image_root):
+    os.environ.update({
+        "MONGO_URI": mongo_uri,
+        "SECRET_KEY": os.getenv("SECRET_KEY", "bench"),
+        "ANALYSIS_BACKEND": "fake",
+        "FAKE_MODEL_LATENCY": str(model_latency),
+        "BCRYPT_LOG_ROUNDS": str(bcrypt_rounds),
+        "RESPONSE_CACHE_URL": "",
+        "MONGO_TRANSACTIONS": "false",
+        "ARCHIVE_PATH": tempfile.mkdtemp(dir=image_root)
+    })
+    # Job mode should measure submission, not the queue filling up
+    os.environ.setdefault("ANALYSIS_MAX_PENDING", "10000")
+    if mock:
+        try:
+            import mongomock
+        except ImportError:
+            raise click.ClickException("--mock needs the mongomock package (pip install mongomock)")
+        import flask_pymongo
+        flask_pymongo.MongoClient = mongomock.MongoClient
+        _patch_mongomock_bulk()
+        os.environ.update({"IMAGE_STORE": "local", "IMAGE_STORE_PATH": image_root})
+
+    import main
+
+    app = main.create_app()
+    return app, main
+
+
+def reset_database(main, mock):
+    db = main.mongo.db
+    if not mock and "bench" not in db.name:
+        raise click.ClickException(f"Refusing to drop database {db.name!r}; use a database whose name contains 'bench'")
+    main.mongo.cx.drop_database(db.name)
+    main.ensure_indexes(db)
+
+
+def run_requests(app, requests, concurrency):
+    """Send requests through test clients; returns [(name, seconds, status)] and the wall time."""
+    local = threading.local()
+
+    def send(request):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        started = time.perf_counter()
+        response = client.open(request["path"], method=request["method"], query_string=request.get("query"), json=request.get("json"))
+        # Drain streamed bodies so exports are timed end to end
+        response.get_data()
+        return request["name"], time.perf_counter() - started, response.status_code
+
+    started = time.perf_counter()
+    if concurrency <= 1:
+        results = [send(request) for request in requests]
+    else:
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(send, requests))
+    return results, time.perf_counter() - started
+
+
+def measure_memory(app, requests):
+    """Peak Python heap allocated while serving each request, in KiB."""
+    client = app.test_client()
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for request in requests:
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            client.open(request["path"], method=request["method"], query_string=request.get("query"), json=request.get("json")).get_data()
+            peaks.setdefault(request["name"], []).append((tracemalloc.get_traced_memory()[1] - baseline) / 1024)
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def summarize(results, wall_time, memory):
+    by_name = {}
+    for name, seconds, status in results:
+        entry = by_name.setdefault(name, {"latencies": [], "errors": 0, "statuses": {}})
+        entry["latencies"].append(seconds * 1000)
+        entry["statuses"][str(status)] = entry["statuses"].get(str(status), 0) + 1
+        if status >= 500:
+            entry["errors"] += 1
+
+    summary = {}
+    for name, entry in sorted(by_name.items()):
+        latencies = sorted(entry["latencies"])
+        peaks = sorted(memory.get(name, []))
+        summary[name] = {
+            "requests": len(latencies),
+            "errors": entry["errors"],
+            "statuses": entry["statuses"],
+            "p50_ms": percentile(latencies, 0.50),
+            "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99),
+            "mean_ms": sum(latencies) / len(latencies),
+            "throughput_rps": len(latencies) / wall_time if wall_time else None,
+            "peak_heap_kib": percentile(peaks, 0.50)
+        }
+    return summary
+
+
+def run_scale(app, main, scale, options):
+    rng = random.Random(options["seed"])
+    started = time.perf_counter()
+    data = seed(
+        main.mongo.db, main.images, scale, seed=options["seed"],
+        password_hash=main.passwords.hash(BENCH_PASSWORD), locations=not options["mock"], archive=main.request_archive
+    )
+    data["password"] = BENCH_PASSWORD
+    seed_seconds = time.perf_counter() - started
+
+    endpoints = {}
+    if options["traffic"]:
+        requests = load_traffic(options["traffic"], rng, data)
+        run_requests(app, requests[:options["warmup"]], 1)
+        results, wall_time = run_requests(app, requests, options["concurrency"])
+        memory = measure_memory(app, requests[:options["memory_samples"]])
+        endpoints = summarize(results, wall_time, memory)
+        # Throughput of a replay is for the whole mix, not per endpoint
+        for entry in endpoints.values():
+            entry["throughput_rps"] = len(results) / wall_time
+    else:
+        for name in options["scenarios"]:
+            build = SCENARIOS[name][1]
+
+            def make(count):
+                requests = [build(rng, data) for _ in range(count)]
+                for request in requests:
+                    request["name"] = name
+                return requests
+
+            run_requests(app, make(options["warmup"]), 1)
+            results, wall_time = run_requests(app, make(options["requests"]), options["concurrency"])
+            memory = measure_memory(app, make(options["memory_samples"]))
+            endpoints.update(summarize(results, wall_time, memory))
+
+        if options["mixed"]:
+            requests = mixed(rng, data, options["mixed"], options["scenarios"])
+            results, wall_time = run_requests(app, requests, options["concurrency"])
+            latencies = sorted(seconds * 1000 for _, seconds, _ in results)
+            endpoints["mixed"] = {
+                "requests": len(results),
+                "errors": sum(1 for _, _, status in results if status >= 500),
+                "statuses": {},
+                "p50_ms": percentile(latencies, 0.50),
+                "p95_ms": percentile(latencies, 0.95),
+                "p99_ms": percentile(latencies, 0.99),
+                "mean_ms": sum(latencies) / len(latencies),
+                "throughput_rps": len(results) / wall_time,
+                "peak_heap_kib": None
+            }
+
+    return {
+        "scale": scale,
+        "seeded": data["counts"],
+        "seed_seconds": seed_seconds,
+        "max_rss_kib": max_rss_kib(),
+        "endpoints": endpoints
+    }
+
+
+def max_rss_kib():
+    try:
+        import resource
+    except ImportError:
+        # Not available on Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def environment(main, mock, options):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    if mock:
+        server = "mongomock"
+    else:
+        server = "mongod " + main.mongo.cx.server_info().get("version", "?")
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "database": server,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "options": {key: value for key, value in options.items() if key != "scenarios"}
+    }
+
+
+def print_report(report):
+    header = f"{'scale':>8} {'endpoint':36} {'n':>5} {'5xx':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'heap KiB':>9}"
+    click.echo(header)
+    click.echo("-" * len(header))
+
+    def number(value, digits=2):
+        return "-" if value is None else f"{value:.{digits}f}"
+
+    for run in report["runs"]:
+        for name, entry in run["endpoints"].items():
+            click.echo(
+                f"{run['scale']:>8} {name[:36]:36} {entry['requests']:>5} {entry['errors']:>4} "
+                f"{number(entry['p50_ms']):>8} {number(entry['p95_ms']):>8} {number(entry['p99_ms']):>8} "
+                f"{number(entry['throughput_rps'], 1):>8} {number(entry['peak_heap_kib'], 0):>9}"
+            )
+        click.echo(f"{run['scale']:>8} seeded {run['seeded']} in {run['seed_seconds']:.1f}s, max RSS {run['max_rss_kib']} KiB")
+
+
+def compare(report, baseline, threshold):
+    """Return a line for every endpoint whose p95 or error count got worse than the baseline."""
+    previous = {
+        (run["scale"], name): entry
+        for run in baseline["runs"] for name, entry in run["endpoints"].items()
+    }
+    regressions = []
+    for run in report["runs"]:
+        for name, entry in run["endpoints"].items():
+            old = previous.get((run["scale"], name))
+            if not old:
+                continue
+            if entry["errors"] > old["errors"]:
+                regressions.append(f"{run['scale']} {name}: errors {old['errors']} -> {entry['errors']}")
+            if old["p95_ms"] and entry["p95_ms"] - old["p95_ms"] > NOISE_FLOOR_MS and entry["p95_ms"] > old["p95_ms"] * (1 + threshold):
+                regressions.append(f"{run['scale']} {name}: p95 {old['p95_ms']:.2f} -> {entry['p95_ms']:.2f} ms")
+    return regressions
+
+
+@click.command()
+@click.option("--scale", "scales", type=int, multiple=True, default=[1000], show_default=True, help="Donations to seed; repeat for several scales.")
+@click.option("--mongo-uri", default=lambda: os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017/bridge_bench"), help="Database to seed; it is dropped first.")
+@click.option("--mock", is_flag=True, help="Use an in-memory mongomock database instead of a server.")
+@click.option("--requests", "request_count", type=int, default=200, show_default=True, help="Timed requests per scenario.")
+@click.option("--warmup", type=int, default=10, show_default=True)
+@click.option("--concurrency", type=int, default=1, show_default=True, help="Client threads sending requests.")
+@click.option("--memory-samples", type=int, default=10, show_default=True, help="Requests per scenario traced for heap usage.")
+@click.option("--mixed", "mixed_count", type=int, default=0, help="Also replay this many requests drawn from every scenario by weight.")
+@click.option("--scenario", "scenario_filter", multiple=True, help="Only run scenarios whose name contains this text.")
+@click.option("--traffic", type=click.Path(exists=True, dir_okay=False), help="Replay recorded traffic (JSON lines) instead of the built-in scenarios.")
+@click.option("--model-latency", type=float, default=0.5, show_default=True, help="Seconds the fake analysis model sleeps per call.")
+@click.option("--bcrypt-rounds", type=int, default=12, show_default=True)
+@click.option("--seed", "random_seed", type=int, default=0, show_default=True)
+@click.option("-o", "--output", type=click.Path(dir_okay=False), help="Write the results as JSON.")
+@click.option("--compare", "baseline_path", type=click.Path(exists=True, dir_okay=False), help="Fail if p95 or errors regress against this results file.")
+@click.option("--threshold", type=float, default=0.25, show_default=True, help="Allowed relative p95 increase for --compare.")
+def benchmark(scales, mongo_uri, mock, request_count, warmup, concurrency, memory_samples, mixed_count, scenario_filter,
+              traffic, model_latency, bcrypt_rounds, random_seed, output, baseline_path, threshold):
+    if mock:
+        mongo_uri = "mongodb://localhost:27017/bridge_bench"
+    scenarios = [name for name in SCENARIOS if not scenario_filter or any(text in name for text in scenario_filter)]
+    if not scenarios and not traffic:
+        raise click.ClickException("No scenario matches --scenario")
+
+    options = {
+        "requests": request_count,
+        "warmup": warmup,
+        "concurrency": concurrency,
+        "memory_samples": memory_samples,
+        "mixed": mixed_count,
+        "traffic": traffic,
+        "model_latency": model_latency,
+        "bcrypt_rounds": bcrypt_rounds,
+        "seed": random_seed,
+        "mock": mock,
+        "scenarios": scenarios
+    }
+
+    with tempfile.TemporaryDirectory() as image_root:
+        report = {"runs": []}
+        for scale in scales:
+            app, main = build_app(mongo_uri, mock, model_latency, bcrypt_rounds, image_root)
+            with app.app_context():
+                reset_database(main, mock)
+                if "environment" not in report:
+                    report["environment"] = environment(main, mock, options)
+                click.echo(f"Seeding {scale} donations...", err=True)
+                report["runs"].append(run_scale(app, main, scale, options))
+        report["environment"]["options"]["scenarios"] = scenarios
+
+    print_report(report)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), threshold)
+        for line in regressions:
+            click.echo(f"REGRESSION {line}", err=True)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,234 @@
+import random
+import uuid
+from datetime import datetime, timedelta
+from io import BytesIO
+
+from bson.objectid import ObjectId
+from PIL import Image
+
+import dashboard
+import rollups
+import search
+from analysis import FAKE_RESPONSE
+
+CATEGORIES = ["Cloths", "Non-perishable Food", "School Supplies", "Hygiene Products", "Baby Supplies", "Books", "Other"]
+CONDITIONS = ["New", "Like New", "Good", "Fair"]
+START_DATE = datetime(2023, 1, 1)
+DAYS = 730
+CHUNK = 10000
+
+# Donations per donor and per organisation at every scale
+DONATIONS_PER_DONOR = 10
+DONATIONS_PER_ORGANISATION = 50
+RESOLVED_SHARE = 0.2
+# Resolved requests from the first half of the date range go to the archive
+ARCHIVE_CUTOFF = START_DATE + timedelta(days=DAYS // 2)
+# Accepted pickups are booked over the last two weeks of the date range
+PICKUPS_PER_ORGANISATION = 5
+PICKUP_DAYS = 14
+ANALYSIS_JOBS = 50
+# Donors and organisations are spread over roughly 60 x 60 km around here
+CENTRE = (13.40, 52.52)
+SPREAD_DEGREES = 0.3
+
+
+def sample_image(seed, size=(320, 240)):
+    """A small, deterministic PNG; different seeds give different bytes."""
+    rng = random.Random(seed)
+    image = Image.new("RGB", size, tuple(rng.randrange(256) for _ in range(3)))
+    for _ in range(8):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        image.paste(tuple(rng.randrange(256) for _ in range(3)), (x, y, min(x + 40, size[0]), min(y + 40, size[1])))
+    out = BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+def _location(rng):
+    return {"type": "Point", "coordinates": [
+        round(CENTRE[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES), 5),
+        round(CENTRE[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES), 5)
+    ]}
+
+
+def _insert(collection, docs, locations=True):
+    if not locations:
+        for doc in docs:
+            doc.pop("location", None)
+    for start in range(0, len(docs), CHUNK):
+        collection.insert_many(docs[start:start + CHUNK], ordered=False)
+
+
+def _donation(rng, donor_id, location, image_ids):
+    donation_date = START_DATE + timedelta(days=rng.randrange(DAYS), seconds=rng.randrange(86400))
+    itemname = rng.choice(CATEGORIES)
+    return {
+        "_id": ObjectId(),
+        "donor_id": donor_id,
+        "condition": rng.choice(CONDITIONS),
+        "number_items": rng.randint(1, 20),
+        "donation_date": donation_date.strftime(rollups.DATE_FORMAT)[:-4] + "Z",
+        "additional_notes": f"{itemname} in a box, {rng.randint(1, 5)} bags",
+        "image_id": rng.choice(image_ids),
+        "reused_photo": False,
+        "reused_from": [],
+        "response": f"Here is the analysis of the image:\n1. Type: {itemname}",
+        "itemname": itemname,
+        "location": location
+    }
+
+
+def seed(db, images, scale, seed=0, password_hash="", locations=True, image_count=16, archive=None):
+    """Fill db with ``scale`` donations and proportional donors and organisations.
+
+    The same (scale, seed) always produces the same documents apart from
+    ObjectIds, so runs are comparable. With ``locations=False`` nothing
+    gets coordinates, for databases without geo queries. With a
+    RequestArchive, requests resolved before ARCHIVE_CUTOFF are moved into
+    it. Returns the ids the traffic generator draws from.
+    """
+    rng = random.Random(seed)
+    donor_count = max(1, scale // DONATIONS_PER_DONOR)
+    organisation_count = max(1, scale // DONATIONS_PER_ORGANISATION)
+
+    image_ids = [images.put(sample_image(seed * 1000 + index)) for index in range(image_count)]
+
+    donor_ids = [str(ObjectId()) for _ in range(donor_count)]
+    organisation_ids = [str(ObjectId()) for _ in range(organisation_count)]
+    donor_locations = {donor_id: _location(rng) for donor_id in donor_ids}
+
+    pending, accepted, declined = [], [], []
+    for _ in range(scale):
+        donor_id = rng.choice(donor_ids)
+        donation = _donation(rng, donor_id, donor_locations[donor_id], image_ids)
+        if rng.random() >= RESOLVED_SHARE:
+            pending.append(donation)
+            continue
+        status = rng.choice(["accepted", "declined"])
+        donation.pop("reused_photo")
+        donation.pop("reused_from")
+        donation.pop("response")
+        donation.update({
+            "organisation_id": rng.choice(organisation_ids),
+            "status": status,
+            "resolved_at": START_DATE + timedelta(days=rng.randrange(DAYS), seconds=rng.randrange(86400))
+        })
+        (accepted if status == "accepted" else declined).append(donation)
+
+    profiles, totals = {}, {}
+    for donation in pending + accepted + declined:
+        profile = profiles.setdefault(donation["donor_id"], {"total_donations": 0, "items_donated": 0, "recent": []})
+        profile["total_donations"] += 1
+        profile["items_donated"] += donation["number_items"]
+        profile["recent"].append(donation)
+        key = (donation["donor_id"], rollups.donation_month(donation["donation_date"]), donation["itemname"])
+        items, count = totals.get(key, (0, 0))
+        totals[key] = (items + donation["number_items"], count + 1)
+
+    _insert(db.donors, [
+        {"_id": ObjectId(donor_id), "email": f"donor{index}@bench.local", "password": password_hash, "Details": "Yes"}
+        for index, donor_id in enumerate(donor_ids)
+    ])
+    donor_profiles = []
+    for index, donor_id in enumerate(donor_ids):
+        profile = profiles.get(donor_id, {"total_donations": 0, "items_donated": 0, "recent": []})
+        recent = sorted(profile["recent"], key=lambda d: d["donation_date"])[-5:]
+        donor_profiles.append({
+            "donor_id": donor_id,
+            "full_name": f"Donor {index}",
+            "phone_number": f"+1555{index:07d}",
+            "address": f"{index} Bench Street",
+            "donation_preferences": rng.choice(CATEGORIES),
+            "location": donor_locations[donor_id],
+            "total_donations": profile["total_donations"],
+            "items_donated": profile["items_donated"],
+            "last_donation": recent[-1]["donation_date"] if recent else None,
+            "recent_donations": [{
+                "donation_id": str(d["_id"]),
+                "itemname": d["itemname"],
+                "number_items": d["number_items"],
+                "donation_date": d["donation_date"]
+            } for d in recent]
+        })
+    _insert(db.donors_collection, donor_profiles, locations)
+
+    _insert(db.organizations, [
+        {"_id": ObjectId(organisation_id), "email": f"org{index}@bench.local", "password": password_hash, "Details": "Yes"}
+        for index, organisation_id in enumerate(organisation_ids)
+    ])
+    pickups = {}
+    for record in accepted:
+        pickups[record["organisation_id"]] = pickups.get(record["organisation_id"], 0) + 1
+    _insert(db.oraganisation_collection, [{
+        "organisation_name": f"Organisation {index}",
+        "registrationNumber": f"REG{index:06d}",
+        "address": f"{index} Charity Road",
+        "organizations_id": organisation_id,
+        "headName": f"Head {index}",
+        "Total_Pickups": pickups.get(organisation_id, 0),
+        "accepted_categories": rng.sample(CATEGORIES, 3),
+        "pickup_radius_km": 15,
+        "location": _location(rng)
+    } for index, organisation_id in enumerate(organisation_ids)], locations)
+
+    _insert(db.donations, pending, locations)
+    pending_by_category = {}
+    for donation in pending:
+        pending_by_category[donation["itemname"]] = pending_by_category.get(donation["itemname"], 0) + 1
+    _insert(db.counters, [{"_id": dashboard.PENDING_KEY, "count": len(pending)}] + [
+        {"_id": dashboard.pending_key(category), "count": count} for category, count in pending_by_category.items()
+    ])
+    _insert(db.search_terms, [{"_id": term, "count": count} for term, count in search.term_counts(pending).items()])
+    _insert(db.accepted_requests, accepted, locations)
+    _insert(db.declined_requests, declined, locations)
+    _insert(db.donation_rollups, [
+        {"donor_id": donor_id, "month": month, "category": category, "items": items, "donations": count}
+        for (donor_id, month, category), (items, count) in totals.items()
+    ])
+
+    pickup_dates = [(START_DATE + timedelta(days=DAYS - PICKUP_DAYS + day)).strftime("%Y-%m-%d") for day in range(PICKUP_DAYS)]
+    pickups = []
+    for _ in range(organisation_count * PICKUPS_PER_ORGANISATION):
+        donor_id = rng.choice(donor_ids)
+        pickups.append({
+            "donor_id": donor_id,
+            "organisation_id": rng.choice(organisation_ids),
+            "pickup_date": rng.choice(pickup_dates),
+            "pickup_time": f"{rng.randint(8, 17):02d}:{rng.choice(['00', '30'])}",
+            "status": "accepted",
+            "location": donor_locations[donor_id],
+            "created_at": START_DATE + timedelta(days=DAYS - PICKUP_DAYS)
+        })
+    # Pickups without a location are left unrouted rather than dropped
+    _insert(db.pickup_requests, pickups, locations)
+
+    # Finished jobs for status polls; created now so the TTL index keeps them
+    now = datetime.utcnow()
+    job_ids = [uuid.UUID(int=rng.getrandbits(128)).hex for _ in range(ANALYSIS_JOBS)]
+    _insert(db.analysis_jobs, [
+        {"_id": job_id, "status": "done", "attempts": 1, "result": FAKE_RESPONSE, "created_at": now, "updated_at": now}
+        for job_id in job_ids
+    ])
+
+    archived = 0
+    if archive is not None:
+        for collection in (db.accepted_requests, db.declined_requests):
+            archived += archive.archive(collection, ARCHIVE_CUTOFF)[0]
+
+    return {
+        "donor_ids": donor_ids,
+        "organisation_ids": organisation_ids,
+        "pending_ids": [str(d["_id"]) for d in pending],
+        "image_ids": image_ids,
+        "job_ids": job_ids,
+        "pickup_dates": pickup_dates,
+        "counts": {
+            "donors": donor_count,
+            "organisations": organisation_count,
+            "donations": len(pending),
+            "accepted_requests": len(accepted),
+            "declined_requests": len(declined),
+            "archived_requests": archived,
+            "pickup_requests": len(pickups)
+        }
+    }
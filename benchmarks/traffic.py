@@ -0,0 +1,272 @@
+import base64
+import json
+import string
+from datetime import timedelta
+
+from bson.objectid import ObjectId
+
+import rollups
+from benchmarks.seed import ARCHIVE_CUTOFF, CATEGORIES, CONDITIONS, DAYS, START_DATE, sample_image
+
+
+def _date(rng):
+    donation_date = START_DATE + timedelta(days=rng.randrange(DAYS), seconds=rng.randrange(86400))
+    return donation_date.strftime(rollups.DATE_FORMAT)[:-4] + "Z"
+
+
+def _day_range(rng, days):
+    start = START_DATE + timedelta(days=rng.randrange(DAYS - days))
+    return start.strftime("%Y-%m-%d"), (start + timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def _archived_range(rng, days=30):
+    start = START_DATE + timedelta(days=rng.randrange((ARCHIVE_CUTOFF - START_DATE).days - days))
+    return start.strftime("%Y-%m-%d"), (start + timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def _image_data(rng):
+    # A fresh image per request so the analysis cache does not hide the model call
+    return "data:image/png;base64," + base64.b64encode(sample_image(rng.randrange(1 << 30))).decode()
+
+
+def _donation(rng, data, image=False):
+    itemname = rng.choice(CATEGORIES)
+    donation = {
+        "donor_id": rng.choice(data["donor_ids"]),
+        "condition": rng.choice(CONDITIONS),
+        "numberOfItems": rng.randint(1, 20),
+        "donation_date": _date(rng),
+        "Additional_Notes": f"{itemname}, bench run",
+        "apiResponse": f"Here is the analysis of the image:\n1. Type: {itemname}",
+        "itemname": itemname
+    }
+    if image:
+        donation["image"] = _image_data(rng)
+    return donation
+
+
+def _pending_id(data):
+    # Each accept/decline consumes a pending donation; once they run out the
+    # request falls back to the oldest donation of a random donor
+    return data["pending_ids"].pop() if data["pending_ids"] else None
+
+
+def _resolve(path):
+    def build(rng, data):
+        donation_id = _pending_id(data)
+        body = {"organisation_id": rng.choice(data["organisation_ids"])}
+        if donation_id:
+            body["donation_id"] = donation_id
+        else:
+            body["donor_id"] = rng.choice(data["donor_ids"])
+        return {"method": "POST", "path": path, "json": body}
+    return build
+
+
+def _resolve_batch(path, size=20):
+    def build(rng, data):
+        donation_ids = [donation_id for donation_id in (_pending_id(data) for _ in range(size)) if donation_id]
+        return {"method": "POST", "path": path, "json": {
+            "organisation_id": rng.choice(data["organisation_ids"]),
+            "donation_ids": donation_ids or ["0" * 24]
+        }}
+    return build
+
+
+def _archived(path, rng, data):
+    start, end = _archived_range(rng)
+    return {"method": "GET", "path": path, "query": {
+        "archived": "true", "resolved_from": start, "resolved_to": end,
+        "organisation_id": rng.choice(data["organisation_ids"])
+    }}
+
+
+def _donor_profile(rng, data):
+    # A new profile each time; an existing donor_id would get a 400
+    index = rng.randrange(1 << 30)
+    return {"method": "POST", "path": "/donor", "json": {
+        "donor_id": str(ObjectId()),
+        "full_name": f"Bench Donor {index}",
+        "phone_number": f"+1555{index % 10 ** 7:07d}",
+        "address": f"{index} Bench Street",
+        "donation_preferences": rng.choice(CATEGORIES)
+    }}
+
+
+def _organisation_details(rng, data):
+    # Resubmitting updates the stored details; location is left alone
+    organisation_id = rng.choice(data["organisation_ids"])
+    return {"method": "POST", "path": "/oraganisationDetails", "json": {
+        "organizations_id": organisation_id,
+        "organizationName": f"Organisation {organisation_id[-6:]}",
+        "address": f"{rng.randrange(1000)} Charity Road",
+        "acceptedCategories": rng.sample(CATEGORIES, 3),
+        "pickupRadiusKm": rng.choice([10, 15, 25])
+    }}
+
+
+def _login(rng, data):
+    if rng.random() < 0.5:
+        email, user_type = f"donor{rng.randrange(len(data['donor_ids']))}@bench.local", "donor"
+    else:
+        email, user_type = f"org{rng.randrange(len(data['organisation_ids']))}@bench.local", "organisation"
+    return {"method": "POST", "path": "/login", "json": {"email": email, "password": data["password"], "user_type": user_type}}
+
+
+def _register(rng, data):
+    name = "".join(rng.choice(string.ascii_lowercase) for _ in range(12))
+    return {"method": "POST", "path": "/register", "json": {"email": f"{name}@bench.local", "password": data["password"], "user_type": "donor"}}
+
+
+# name -> (weight in the mixed phase, build(rng, data) -> request)
+SCENARIOS = {
+    "GET /leaderBoard": (10, lambda rng, data: {"method": "GET", "path": "/leaderBoard"}),
+    "GET /leaderBoard (deep page)": (2, lambda rng, data: {
+        "method": "GET", "path": "/leaderBoard",
+        "query": {"top": 50, "offset": rng.randrange(max(1, len(data["donor_ids"]) - 50))}
+    }),
+    "GET /leaderBoard/rank": (5, lambda rng, data: {
+        "method": "GET", "path": "/leaderBoard/rank", "query": {"donor_id": rng.choice(data["donor_ids"])}
+    }),
+    "GET /chart": (10, lambda rng, data: {
+        "method": "GET", "path": "/chart", "query": {"donor_id": rng.choice(data["donor_ids"])}
+    }),
+    "GET /chart (year, category)": (3, lambda rng, data: {
+        "method": "GET", "path": "/chart",
+        "query": {"donor_id": rng.choice(data["donor_ids"]), "year": rng.choice(["2023", "2024"]), "category": rng.choice(CATEGORIES)}
+    }),
+    "GET /donationDetails": (10, lambda rng, data: {
+        "method": "GET", "path": "/donationDetails", "query": {"donor_id": rng.choice(data["donor_ids"])}
+    }),
+    "GET /donordetails": (10, lambda rng, data: {
+        "method": "GET", "path": "/donordetails", "query": {"donor_id": rng.choice(data["donor_ids"])}
+    }),
+    "GET /donorInfo": (5, lambda rng, data: {
+        "method": "GET", "path": "/donorInfo", "query": {"donor_ids": ",".join(rng.sample(data["donor_ids"], min(10, len(data["donor_ids"]))))}
+    }),
+    "GET /organisationdetails": (5, lambda rng, data: {
+        "method": "GET", "path": "/organisationdetails", "query": {"organizations_id": rng.choice(data["organisation_ids"])}
+    }),
+    "GET /organisationPickup": (10, lambda rng, data: {
+        "method": "GET", "path": "/organisationPickup", "query": {"organizations_id": rng.choice(data["organisation_ids"])}
+    }),
+    "GET /organisationPickup (filtered)": (3, lambda rng, data: {
+        "method": "GET", "path": "/organisationPickup",
+        "query": {"organizations_id": rng.choice(data["organisation_ids"]), "itemname": rng.choice(CATEGORIES), "limit": 50}
+    }),
+    "GET /donations/search": (5, lambda rng, data: {
+        "method": "GET", "path": "/donations/search", "query": {"q": rng.choice(CATEGORIES), "limit": 20}
+    }),
+    "GET /donations/search (category)": (2, lambda rng, data: {
+        "method": "GET", "path": "/donations/search",
+        "query": {"q": "box bags", "categories": rng.choice(CATEGORIES), "limit": 20, "offset": rng.choice([0, 20, 40])}
+    }),
+    "GET /donations/suggest": (10, lambda rng, data: {
+        "method": "GET", "path": "/donations/suggest", "query": {"q": rng.choice(CATEGORIES)[:rng.randint(1, 3)]}
+    }),
+    "GET /req_accept": (5, lambda rng, data: {
+        "method": "GET", "path": "/req_accept", "query": {"organisation_id": rng.choice(data["organisation_ids"])}
+    }),
+    "GET /req_decline": (5, lambda rng, data: {
+        "method": "GET", "path": "/req_decline", "query": {"organisation_id": rng.choice(data["organisation_ids"])}
+    }),
+    "GET /req_accept (archived)": (1, lambda rng, data: _archived("/req_accept", rng, data)),
+    "GET /req_decline (archived)": (1, lambda rng, data: _archived("/req_decline", rng, data)),
+    "GET /pickupSchedule": (3, lambda rng, data: {
+        "method": "GET", "path": "/pickupSchedule",
+        "query": {"organisation_id": rng.choice(data["organisation_ids"]), "date": rng.choice(data["pickup_dates"])}
+    }),
+    "GET /export/donations (one week)": (1, lambda rng, data: {
+        "method": "GET", "path": "/export/donations", "query": dict(zip(("from", "to"), _day_range(rng, 7)))
+    }),
+    "GET /images/<id>/thumbnail": (5, lambda rng, data: {
+        "method": "GET", "path": f"/images/{rng.choice(data['image_ids'])}/thumbnail"
+    }),
+    "POST /donations": (5, lambda rng, data: {"method": "POST", "path": "/donations", "json": _donation(rng, data)}),
+    "POST /donations (image)": (2, lambda rng, data: {"method": "POST", "path": "/donations", "json": _donation(rng, data, image=True)}),
+    "POST /donations/batch": (1, lambda rng, data: {
+        "method": "POST", "path": "/donations/batch", "json": {"donations": [_donation(rng, data) for _ in range(20)]}
+    }),
+    "POST /acceptRequest": (3, _resolve("/acceptRequest")),
+    "POST /declineRequest": (2, _resolve("/declineRequest")),
+    "POST /acceptRequest/batch": (1, _resolve_batch("/acceptRequest/batch")),
+    "POST /declineRequest/batch": (1, _resolve_batch("/declineRequest/batch")),
+    "POST /acceptRequestorg": (2, lambda rng, data: {"method": "POST", "path": "/acceptRequestorg", "json": {
+        "donor_id": rng.choice(data["donor_ids"]),
+        "organisation_id": rng.choice(data["organisation_ids"]),
+        "pickup_date": _day_range(rng, 1)[0],
+        "pickup_time": f"{rng.randint(8, 17):02d}:{rng.choice(['00', '30'])}"
+    }}),
+    "POST /imageupload": (2, lambda rng, data: {"method": "POST", "path": "/imageupload", "json": {"image": _image_data(rng)}}),
+    "POST /imageupload (job)": (3, lambda rng, data: {
+        "method": "POST", "path": "/imageupload", "json": {"image": _image_data(rng), "mode": "job"}
+    }),
+    "GET /imageupload/jobs/<id>": (10, lambda rng, data: {
+        "method": "GET", "path": f"/imageupload/jobs/{rng.choice(data['job_ids'])}"
+    }),
+    "POST /donor": (1, _donor_profile),
+    "POST /oraganisationDetails": (1, _organisation_details),
+    "POST /login": (3, _login),
+    "POST /register": (1, _register),
+    "GET /metrics": (1, lambda rng, data: {"method": "GET", "path": "/metrics"}),
+}
+
+
+def mixed(rng, data, count, names=None):
+    """``count`` requests drawn from SCENARIOS by weight, tagged with their scenario name."""
+    names = list(names or SCENARIOS)
+    weights = [SCENARIOS[name][0] for name in names]
+    requests = []
+    for name in rng.choices(names, weights, k=count):
+        request = SCENARIOS[name][1](rng, data)
+        request["name"] = name
+        requests.append(request)
+    return requests
+
+
+def _fill(value, rng, data):
+    if isinstance(value, str):
+        placeholders = {
+            "{donor_id}": lambda: rng.choice(data["donor_ids"]),
+            "{organisation_id}": lambda: rng.choice(data["organisation_ids"]),
+            "{donation_id}": lambda: _pending_id(data) or "0" * 24,
+            "{image_id}": lambda: rng.choice(data["image_ids"]),
+            "{job_id}": lambda: rng.choice(data["job_ids"])
+        }
+        for placeholder, pick in placeholders.items():
+            if placeholder in value:
+                value = value.replace(placeholder, pick())
+        return value
+    if isinstance(value, list):
+        return [_fill(item, rng, data) for item in value]
+    if isinstance(value, dict):
+        return {key: _fill(item, rng, data) for key, item in value.items()}
+    return value
+
+
+def load_traffic(path, rng, data):
+    """Read recorded traffic, one JSON request per line.
+
+    Each line has ``method``, ``path`` and optionally ``query``, ``json``
+    and ``name``. ``{donor_id}``, ``{organisation_id}``, ``{donation_id}``,
+    ``{image_id}`` and ``{job_id}`` in any string are replaced with ids
+    from the seeded data, so a capture from production can be replayed
+    against any scale.
+    """
+    requests = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            request = {
+                "method": entry.get("method", "GET").upper(),
+                "path": _fill(entry["path"], rng, data),
+                "query": _fill(entry.get("query") or {}, rng, data),
+            }
+            if "json" in entry:
+                request["json"] = _fill(entry["json"], rng, data)
+            request["name"] = entry.get("name") or f"{request['method']} {entry['path']}"
+            requests.append(request)
+    return requests
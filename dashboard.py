@@ -0,0 +1,116 @@
+import itertools
+import re
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from sweep import overwrite_and_sweep
+
+PENDING_KEY = "pending_donations"
+DAY_FORMAT = "%Y-%m-%d"
+
+
+def day(when=None):
+    """The UTC ``YYYY-MM-DD`` bucket for a datetime (now by default)."""
+    return (when or datetime.utcnow()).strftime(DAY_FORMAT)
+
+
+def pickup_day(pickup_date):
+    """Bucket for a client-supplied pickup date; today if it is not ``YYYY-MM-DD...``."""
+    if isinstance(pickup_date, str) and re.match(r"\d{4}-\d{2}-\d{2}", pickup_date):
+        return pickup_date[:10]
+    return day()
+
+
+def pending_key(category):
+    return f"{PENDING_KEY}:{category}"
+
+
+def record_pending(counters, donations, sign, session=None):
+    """Count ``donations`` in (sign 1) or out of (sign -1) the pending total and their categories."""
+    by_category = {}
+    for donation in donations:
+        if donation.get("itemname"):
+            key = pending_key(donation["itemname"])
+            by_category[key] = by_category.get(key, 0) + 1
+    counters.bulk_write([UpdateOne({"_id": PENDING_KEY}, {"$inc": {"count": sign * len(donations)}}, upsert=True)] + [
+        UpdateOne({"_id": key}, {"$inc": {"count": sign * count}}, upsert=True)
+        for key, count in by_category.items()
+    ], ordered=False, session=session)
+
+
+def record_resolved(daily, organisations, organisation_id, status, count, session=None):
+    """Count donations an organisation just accepted or declined."""
+    daily.update_one({"organisation_id": organisation_id, "day": day()}, {"$inc": {status: count}}, upsert=True, session=session)
+    if status == "accepted":
+        organisations.update_one({"organizations_id": organisation_id}, {"$inc": {"Total_Pickups": count}}, session=session)
+
+
+def record_scheduled(daily, organisation_id, pickup_date, session=None):
+    daily.update_one({"organisation_id": organisation_id, "day": pickup_day(pickup_date)}, {"$inc": {"scheduled": 1}}, upsert=True, session=session)
+
+
+def organisation_counters(counters, daily, organisation_id, categories=None):
+    """Live counters for the organisation dashboard; two reads by unique key.
+
+    Pending_Pickups counts pending donations in ``categories`` (every
+    pending donation when there are none), wherever they are, so it can
+    be larger than a pickup list that is also limited by distance.
+    """
+    keys = [pending_key(category) for category in categories] if categories else [PENDING_KEY]
+    pending = sum(max(doc.get("count", 0), 0) for doc in counters.find({"_id": {"$in": keys}}))
+    today = daily.find_one({"organisation_id": organisation_id, "day": day()}) or {}
+    return {
+        "Pending_Pickups": pending,
+        "Completed_Today": today.get("accepted", 0),
+        "Scheduled_Today": today.get("scheduled", 0)
+    }
+
+
+def reconcile(counters, daily, organisations, donations, accepted, declined, pickups, archived_accepted=(), archived_declined=()):
+    """Recompute every counter from the source collections and archived requests.
+
+    Returns (pending donations, daily buckets written). Daily buckets no
+    request backs up any more are dropped, except today's buckets that a
+    live write created during the run. A resolve or pickup recorded while
+    it runs can be overwritten, so run it when traffic is quiet.
+    """
+    pending = donations.count_documents({})
+    counters.update_one({"_id": PENDING_KEY}, {"$set": {"count": pending}}, upsert=True)
+    by_category = {
+        pending_key(group["_id"]): group["count"]
+        for group in donations.aggregate([{"$group": {"_id": "$itemname", "count": {"$sum": 1}}}])
+        if group["_id"]
+    }
+    for key, count in by_category.items():
+        counters.update_one({"_id": key}, {"$set": {"count": count}}, upsert=True)
+    counters.delete_many({"_id": {"$regex": f"^{re.escape(PENDING_KEY)}:", "$nin": list(by_category)}})
+
+    buckets, totals = {}, {}
+    for status, source, archived in (("accepted", accepted, archived_accepted), ("declined", declined, archived_declined)):
+        records = itertools.chain(source.find({}, {"organisation_id": 1, "resolved_at": 1}), archived)
+        for record in records:
+            if status == "accepted":
+                totals[record.get("organisation_id")] = totals.get(record.get("organisation_id"), 0) + 1
+            # Requests resolved before resolved_at was stored only count towards the totals
+            if not record.get("resolved_at"):
+                continue
+            bucket = buckets.setdefault((record["organisation_id"], day(record["resolved_at"])), {})
+            bucket[status] = bucket.get(status, 0) + 1
+    for pickup in pickups.find({}, {"organisation_id": 1, "pickup_date": 1}):
+        bucket = buckets.setdefault((pickup["organisation_id"], pickup_day(pickup.get("pickup_date"))), {})
+        bucket["scheduled"] = bucket.get("scheduled", 0) + 1
+
+    overwrite_and_sweep(daily, (
+        ({"organisation_id": organisation_id, "day": bucket_day}, {
+            "accepted": bucket.get("accepted", 0),
+            "declined": bucket.get("declined", 0),
+            "scheduled": bucket.get("scheduled", 0)
+        })
+        for (organisation_id, bucket_day), bucket in buckets.items()
+    ), keep={"rebuilt_at": {"$exists": False}, "day": {"$gte": day()}})
+
+    for organisation in organisations.find({}, {"organizations_id": 1}):
+        total = totals.get(organisation.get("organizations_id"), 0)
+        organisations.update_one({"_id": organisation["_id"]}, {"$set": {"Total_Pickups": total}})
+    return pending, len(buckets)
@@ -0,0 +1,43 @@
+import multiprocessing
+import os
+
+# Serve with: gunicorn -c gunicorn.conf.py "main:create_app()"
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8000)}"
+
+# Requests spend most of their time waiting on Mongo or Gemini, so each
+# worker process runs several threads (or greenlets with gevent, which
+# needs `pip install gevent`) and one worker per core is enough.
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 200))
+
+# Each worker builds its own MongoClient in create_app(); size its pool to
+# the requests that worker can have in flight.
+if worker_class == "gevent":
+    os.environ.setdefault("MONGO_MAX_POOL_SIZE", str(min(worker_connections, 100)))
+else:
+    os.environ.setdefault("MONGO_MAX_POOL_SIZE", str(max(threads * 2, 10)))
+
+# Every pool and cap the app builds is per worker process, so the totals
+# are these times `workers`. Default them so the whole server stays close
+# to the single-process defaults: one bcrypt process per worker (about
+# one per core), about four job-mode Gemini calls (at least one per
+# worker) and about 32 queued images overall.
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "1")
+os.environ.setdefault("ANALYSIS_WORKERS", str(max(1, 4 // workers)))
+os.environ.setdefault("ANALYSIS_MAX_PENDING", str(max(1, 32 // workers)))
+
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+# Synchronous /imageupload calls can take a while; job mode avoids that
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 200))
+
+# MongoClient is not fork-safe, so the app is built inside each worker
+preload_app = False
+
+accesslog = "-"
+errorlog = "-"
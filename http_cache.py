@@ -0,0 +1,100 @@
+import functools
+import gzip
+import hashlib
+
+from bson.objectid import ObjectId
+from flask import current_app, request
+from pymongo import ReturnDocument
+
+try:
+    import brotli
+except ImportError:
+    # Optional; without it only gzip is offered
+    brotli = None
+
+COMPRESSIBLE_TYPES = {"application/json", "application/x-ndjson", "text/plain", "text/html", "text/csv"}
+
+
+def _encodings():
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def compress(response, min_size=1024):
+    """Encode a buffered response with the best encoding the client accepts."""
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+    if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+            or response.status_code in (204, 304) or "Content-Encoding" in response.headers):
+        return response
+
+    body = response.get_data()
+    if len(body) < min_size:
+        return response
+    encoding = request.accept_encodings.best_match(_encodings())
+    if encoding == "br":
+        body = brotli.compress(body, quality=5)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=6)
+    else:
+        return response
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+class CollectionVersions:
+    """A version token per collection, replaced whenever the API writes to it.
+
+    ETags built from these tokens let a GET be answered with 304 before
+    the collection is queried at all.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def bump(self, *names):
+        # Call after the write has landed: a reader that sees the old token
+        # with new data only costs one extra download, never a stale 304
+        for name in names:
+            self.collection.update_one({"_id": name}, {"$set": {"version": ObjectId()}}, upsert=True)
+
+    def current(self, names):
+        found = {doc["_id"]: doc["version"] for doc in self.collection.find({"_id": {"$in": list(names)}})}
+        for name in names:
+            if name not in found:
+                found[name] = self.collection.find_one_and_update(
+                    {"_id": name}, {"$setOnInsert": {"version": ObjectId()}},
+                    upsert=True, return_document=ReturnDocument.AFTER
+                )["version"]
+        return [str(found[name]) for name in names]
+
+
+def conditional(versions, *names):
+    """Give a GET view a weak ETag derived from the versions of ``names`` and its query string.
+
+    A matching If-None-Match gets 304 without running the view.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                key = "|".join([request.path, *versions.current(names), *(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))])
+                etag = hashlib.sha1(key.encode("utf-8")).hexdigest()
+            except Exception as e:
+                current_app.logger.warning("Could not read collection versions: %s", e)
+                return view(*args, **kwargs)
+
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.headers["Cache-Control"] = "private, no-cache"
+            response.vary.add("Accept-Encoding")
+            return response
+        return wrapper
+    return decorator
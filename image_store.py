@@ -0,0 +1,147 @@
+import base64
+import hashlib
+import os
+import re
+from abc import ABC, abstractmethod
+from io import BytesIO
+
+import gridfs
+from PIL import Image
+
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_QUALITY = 80
+IMAGE_ID_RE = re.compile(r"[0-9a-f]{64}")
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def is_image_id(value):
+    return bool(IMAGE_ID_RE.fullmatch(value or ""))
+
+
+def content_id(raw):
+    return hashlib.sha256(raw).hexdigest()
+
+
+def decode_image(image_data):
+    """Accept a data URL or bare base64 string and return the raw bytes."""
+    if "," in image_data and image_data.lstrip().startswith("data:"):
+        image_data = image_data.split(",", 1)[1]
+    try:
+        return base64.b64decode(image_data, validate=False)
+    except (ValueError, TypeError) as e:
+        raise InvalidImage(f"Invalid image data: {e}")
+
+
+def make_thumbnail(image):
+    thumb = image.copy()
+    if thumb.mode not in ("RGB", "L"):
+        thumb = thumb.convert("RGB")
+    thumb.thumbnail(THUMBNAIL_SIZE)
+    out = BytesIO()
+    thumb.save(out, format="JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def prepare_image(raw):
+    """Validate raw image bytes and return (image_id, content_type, thumbnail bytes)."""
+    try:
+        image = Image.open(BytesIO(raw))
+        image.load()
+    except Exception as e:
+        raise InvalidImage(f"Invalid image data: {e}")
+    content_type = Image.MIME.get(image.format, "application/octet-stream")
+    return content_id(raw), content_type, make_thumbnail(image)
+
+
+class ImageStore(ABC):
+    """Content-addressed image storage.
+
+    Images are keyed by the sha256 of their bytes, so storing the same image
+    twice is a no-op and every stored variant is immutable.
+    """
+
+    def put(self, raw):
+        image_id, content_type, thumbnail = prepare_image(raw)
+        if not self.exists(image_id):
+            self._write(image_id, "original", raw, content_type)
+            self._write(image_id, "thumbnail", thumbnail, "image/jpeg")
+        return image_id
+
+    def put_base64(self, image_data):
+        return self.put(decode_image(image_data))
+
+    @abstractmethod
+    def exists(self, image_id):
+        pass
+
+    @abstractmethod
+    def get(self, image_id, variant="original"):
+        """Return (bytes, content_type) or None if the image is unknown."""
+
+    @abstractmethod
+    def _write(self, image_id, variant, data, content_type):
+        pass
+
+
+class GridFSImageStore(ImageStore):
+    def __init__(self, db, bucket_name="images"):
+        self.fs = gridfs.GridFS(db, collection=bucket_name)
+
+    @staticmethod
+    def _filename(image_id, variant):
+        return image_id if variant == "original" else f"{image_id}.{variant}"
+
+    def exists(self, image_id):
+        return self.fs.exists(filename=self._filename(image_id, "thumbnail"))
+
+    def get(self, image_id, variant="original"):
+        grid_out = self.fs.find_one({"filename": self._filename(image_id, variant)})
+        if grid_out is None:
+            return None
+        return grid_out.read(), grid_out.content_type
+
+    def _write(self, image_id, variant, data, content_type):
+        self.fs.put(data, filename=self._filename(image_id, variant), content_type=content_type)
+
+
+class LocalImageStore(ImageStore):
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, image_id, variant):
+        return os.path.join(self.root, image_id[:2], f"{image_id}.{variant}")
+
+    def exists(self, image_id):
+        return os.path.exists(self._path(image_id, "thumbnail"))
+
+    def get(self, image_id, variant="original"):
+        path = self._path(image_id, variant)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path + ".type") as f:
+            content_type = f.read()
+        return data, content_type
+
+    def _write(self, image_id, variant, data, content_type):
+        path = self._path(image_id, variant)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        with open(path + ".type", "w") as f:
+            f.write(content_type)
+        os.replace(tmp_path, path)
+
+
+def create_image_store(db, backend=None, root=None):
+    backend = backend or os.getenv("IMAGE_STORE", "gridfs")
+    if backend == "local":
+        return LocalImageStore(root or os.getenv("IMAGE_STORE_PATH", "images"))
+    if backend == "gridfs":
+        return GridFSImageStore(db)
+    raise ValueError(f"Unknown image store backend: {backend}")
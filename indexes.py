@@ -0,0 +1,133 @@
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+from rollups import ROLLUP_KEY
+from search import TEXT_WEIGHTS
+
+LEADERBOARD_SORT = [("items_donated", DESCENDING), ("_id", ASCENDING)]
+
+# Every index the routes rely on, by collection name. ensure_indexes() is
+# idempotent, so new entries are picked up on the next start.
+INDEXES = {
+    "donors": [
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "organizations": [
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "donors_collection": [
+        IndexModel([("donor_id", ASCENDING)], unique=True),
+        IndexModel(LEADERBOARD_SORT),
+    ],
+    "donations": [
+        IndexModel([("donor_id", ASCENDING), ("donation_date", ASCENDING)]),
+        IndexModel([("donor_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("location", GEOSPHERE), ("itemname", ASCENDING)]),
+        # Donations without a location, listed after the nearby ones
+        IndexModel([("location", ASCENDING), ("_id", ASCENDING)]),
+        # A collection can have only one text index; change it by dropping donation_search
+        IndexModel([(field, TEXT) for field in TEXT_WEIGHTS], weights=TEXT_WEIGHTS, name="donation_search"),
+    ],
+    "oraganisation_collection": [
+        IndexModel([("organizations_id", ASCENDING)], unique=True),
+    ],
+    "pickup_requests": [
+        IndexModel([("organisation_id", ASCENDING), ("pickup_date", ASCENDING)]),
+    ],
+    "accepted_requests": [
+        IndexModel([("organisation_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("donor_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("resolved_at", ASCENDING)]),
+    ],
+    "declined_requests": [
+        IndexModel([("organisation_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("donor_id", ASCENDING), ("_id", ASCENDING)]),
+        IndexModel([("resolved_at", ASCENDING)]),
+    ],
+    "donation_rollups": [
+        IndexModel(ROLLUP_KEY, unique=True),
+    ],
+    "organisation_daily": [
+        IndexModel([("organisation_id", ASCENDING), ("day", ASCENDING)], unique=True),
+    ],
+    "analysis_jobs": [
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=24 * 60 * 60),
+    ],
+    "image_fingerprints": [
+        IndexModel([("bands", ASCENDING)]),
+        IndexModel([("image_id", ASCENDING), ("donor_id", ASCENDING)], unique=True),
+    ],
+}
+
+# Representative query of each route: (route, collection, filter, sort, limit)
+QUERY_SHAPES = [
+    ("/register, /login (donor)", "donors", {"email": "x"}, None, 1),
+    ("/register, /login (organisation)", "organizations", {"email": "x"}, None, 1),
+    ("/donordetails, /donations", "donors_collection", {"donor_id": "x"}, None, 1),
+    ("/donorInfo", "donors_collection", {"donor_id": {"$in": ["x", "y"]}}, None, 0),
+    ("/leaderBoard", "donors_collection", {}, LEADERBOARD_SORT, 50),
+    ("/leaderBoard/rank", "donors_collection", {"items_donated": {"$gt": 0}}, None, 0),
+    ("/donationDetails", "donations", {"donor_id": "x"}, [("_id", ASCENDING)], 101),
+    ("/organisationPickup", "donations", {}, [("_id", ASCENDING)], 101),
+    ("/organisationPickup (nearby)", "donations", {
+        "location": {"$nearSphere": {"$geometry": {"type": "Point", "coordinates": [0, 0]}, "$maxDistance": 25000}},
+        "itemname": {"$in": ["Books", "Cloths"]}
+    }, None, 101),
+    ("/organisationPickup (unlocated)", "donations", {"location": None, "itemname": {"$in": ["Books", "Cloths"]}}, [("_id", ASCENDING)], 101),
+    ("/donations/search", "donations", {"$text": {"$search": "winter coats"}}, None, 0),
+    ("/donations/suggest", "search_terms", {"_id": {"$regex": "^co"}, "count": {"$gt": 0}}, [("count", DESCENDING), ("_id", ASCENDING)], 10),
+    ("/acceptRequest, /declineRequest (by donor)", "donations", {"donor_id": "x"}, [("_id", ASCENDING)], 1),
+    ("/chart", "donation_rollups", {"donor_id": "x", "month": {"$gte": "2024-01"}}, [("month", DESCENDING)], 0),
+    ("/organisationdetails", "oraganisation_collection", {"organizations_id": "x"}, None, 1),
+    ("/organisationdetails (today)", "organisation_daily", {"organisation_id": "x", "day": "2024-01-01"}, None, 1),
+    ("/acceptRequestorg", "pickup_requests", {"organisation_id": "x", "pickup_date": "2024-01-01"}, None, 0),
+    ("/pickupSchedule", "pickup_requests", {"organisation_id": "x", "pickup_date": {"$gte": "2024-01-01", "$lt": "2024-01-01~"}, "status": "accepted"}, [("_id", ASCENDING)], 0),
+    ("/req_accept", "accepted_requests", {"organisation_id": "x"}, [("_id", ASCENDING)], 101),
+    ("/req_decline", "declined_requests", {"organisation_id": "x"}, [("_id", ASCENDING)], 101),
+    ("archive-requests", "accepted_requests", {"resolved_at": {"$lt": datetime(2024, 1, 1)}}, [("_id", ASCENDING)], 5000),
+    ("/donations (reused photos)", "image_fingerprints", {"bands": {"$in": ["0:0", "1:0"]}}, None, 100),
+]
+
+
+def ensure_indexes(db):
+    """Create every registered index; returns [(collection, error)] for any that failed."""
+    failures = []
+    for name, models in INDEXES.items():
+        try:
+            db[name].create_indexes(models)
+        except OperationFailure as e:
+            # Typically a unique index over data that already has duplicates
+            failures.append((name, str(e)))
+    return failures
+
+
+def _plan_stages(plan):
+    stages = [plan.get("stage")]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += _plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return [stage for stage in stages if stage]
+
+
+def explain_queries(db):
+    """Explain each registered query shape and report the winning plan's stages."""
+    report = []
+    for route, collection, query, sort, limit in QUERY_SHAPES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        plan = cursor.explain()["queryPlanner"]["winningPlan"]
+        stages = _plan_stages(plan)
+        report.append({
+            "route": route,
+            "collection": collection,
+            "stages": stages,
+            "collection_scan": "COLLSCAN" in stages
+        })
+    return report
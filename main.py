@@ -1,38 +1,178 @@
-from flask import Flask, request, jsonify, session
-from flask_bcrypt import Bcrypt
+from flask import Flask, Blueprint, Response, current_app, g, request, jsonify, session, url_for, make_response, stream_with_context
+from werkzeug.local import LocalProxy
 from flask_pymongo import PyMongo
 from bson.objectid import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
-import google.generativeai as genai
 import base64
 from io import BytesIO
 from PIL import Image
-from datetime import datetime
-import uuid
-
-app = Flask(__name__)
-load_dotenv()
-
-app.config["MONGO_URI"] = os.getenv("MONGO_URI")
-app.config["SECRET_KEY"] = os.getenv("SECRET_KEY")
-
-mongo = PyMongo(app)
-bcrypt = Bcrypt(app)
-CORS(app)
-
-# Collections
-donors = mongo.db.donors
-organizations = mongo.db.organizations
-donors_collection = mongo.db.donors_collection
-donations_collection = mongo.db.donations
-oraganisation_collection = mongo.db.oraganisation_collection
-accepted_requests_collection = mongo.db.accepted_requests
-declined_requests_collection = mongo.db.declined_requests 
-pickup_requests = mongo.db.pickup_requests
-
-@app.route("/register", methods=["POST"])
+from datetime import datetime, timedelta
+import re
+import time
+import click
+from image_store import create_image_store, content_id, decode_image, is_image_id, InvalidImage
+from indexes import ensure_indexes, explain_queries, LEADERBOARD_SORT
+from analysis_cache import AnalysisCache, dhash, find_reused_photo, record_fingerprint
+import rollups
+import dashboard
+from analysis import AnalysisQueue, QueueFull, create_backend, prepare_image
+from passwords import PasswordHasher, HasherBusy
+from response_cache import create_response_cache
+from metrics import Registry, MongoCommandMetrics, SIZE_BUCKETS
+from matching import InvalidLocation, DEFAULT_RADIUS_KM, nearby_pipeline, parse_categories, parse_location, parse_radius, point
+import routing
+import search
+from archive import ArchiveBusy, RequestArchive, parse_range
+from http_cache import CollectionVersions, compress, conditional
+from pagination import parse_limit, parse_offset, parse_after, parse_fields, build_filter, fetch_page, projection, InvalidQuery
+
+mongo = PyMongo()
+api = Blueprint("api", __name__, cli_group=None)
+
+# Collections, resolved against the client create_app() configured
+donors = LocalProxy(lambda: mongo.db.donors)
+organizations = LocalProxy(lambda: mongo.db.organizations)
+donors_collection = LocalProxy(lambda: mongo.db.donors_collection)
+donations_collection = LocalProxy(lambda: mongo.db.donations)
+oraganisation_collection = LocalProxy(lambda: mongo.db.oraganisation_collection)
+accepted_requests_collection = LocalProxy(lambda: mongo.db.accepted_requests)
+declined_requests_collection = LocalProxy(lambda: mongo.db.declined_requests)
+pickup_requests = LocalProxy(lambda: mongo.db.pickup_requests)
+donation_rollups = LocalProxy(lambda: mongo.db.donation_rollups)
+analysis_jobs = LocalProxy(lambda: mongo.db.analysis_jobs)
+image_fingerprints = LocalProxy(lambda: mongo.db.image_fingerprints)
+counters = LocalProxy(lambda: mongo.db.counters)
+organisation_daily = LocalProxy(lambda: mongo.db.organisation_daily)
+search_terms = LocalProxy(lambda: mongo.db.search_terms)
+
+# Bumped after every API write to a collection that a conditional GET reads
+collection_versions = CollectionVersions(LocalProxy(lambda: mongo.db.collection_versions))
+
+metrics_registry = Registry()
+mongo_command_metrics = MongoCommandMetrics(metrics_registry)
+http_request_duration = metrics_registry.histogram(
+    "http_request_duration_seconds", "Time spent handling a request.", ["route", "method", "status"]
+)
+model_call_duration = metrics_registry.histogram(
+    "model_call_duration_seconds", "Image analysis model call latency.", ["backend", "outcome"]
+)
+image_payload_bytes = metrics_registry.histogram(
+    "image_payload_bytes", "Size of uploaded images and of what is sent to the model.", ["stage"], buckets=SIZE_BUCKETS
+)
+metrics_registry.gauge_collector(
+    "cache_lookups", "Cache lookups by result since the process started.", ["cache", "result"],
+    lambda: [
+        (("response", "hit"), response_cache.stats()["hits"]),
+        (("response", "miss"), response_cache.stats()["misses"]),
+        (("analysis", "hit_exact"), analysis_cache.hits["exact"]),
+        (("analysis", "hit_similar"), analysis_cache.hits["similar"]),
+        (("analysis", "miss"), analysis_cache.misses)
+    ]
+)
+metrics_registry.gauge_collector(
+    "password_hasher", "Password hashing pool counters since the process started.", ["stat"],
+    lambda: [((stat,), value) for stat, value in passwords.stats().items()]
+)
+
+# Per-process services, built by create_app()
+images = None
+passwords = None
+analysis_backend = None
+analysis_cache = None
+analysis_queue = None
+analysis_image_options = {}
+response_cache = None
+request_archive = None
+
+def invalidate_donor(donor_id):
+    response_cache.delete(f"donordetails:{donor_id}", f"donorinfo:{donor_id}")
+
+def invalidate_organisation(organizations_id):
+    response_cache.delete(f"organisationdetails:{organizations_id}", f"organisationcounters:{organizations_id}")
+
+def image_urls(doc):
+    image_id = doc.get("image_id")
+    if not image_id:
+        # Documents written before images moved to the blob store
+        return {"image": doc.get("image")}
+    return {
+        "image_id": image_id,
+        "image_url": url_for("api.get_image", image_id=image_id),
+        "thumbnail_url": url_for("api.get_image", image_id=image_id, variant="thumbnail")
+    }
+
+def stored_image_id(doc):
+    if doc.get("image_id") or not doc.get("image"):
+        return doc.get("image_id")
+    return images.put_base64(doc["image"])
+
+DONATION_FIELDS = ["donation_id", "donor_id", "condition", "number_items", "donation_date", "additional_notes", "image", "response", "itemname"]
+PICKUP_FIELDS = ["donation_id", "donor_id", "condition", "number_items", "donation_date", "additional_notes", "image", "itemname", "reused_photo"]
+RESOLVED_FIELDS = ["donation_id", "donor_id", "condition", "number_items", "donation_date", "additional_notes", "image", "itemname", "organisation_id", "status"]
+LEADERBOARD_FIELDS = ["donor_id", "full_name", "items_donated"]
+FIELD_ALIASES = {"image": ["image_id", "image"], "donation_id": ["_id"]}
+
+def serialize(doc, fields):
+    item = {}
+    for field in fields:
+        if field == "image":
+            item.update(image_urls(doc))
+        elif field == "donation_id":
+            item[field] = str(doc["_id"])
+        else:
+            item[field] = doc.get(field)
+    return item
+
+def list_page(collection, allowed_fields, filters=(), date_field=None, base_query=None):
+    """Run one keyset page of a list endpoint from the current request's query string."""
+    args = request.args
+    fields = parse_fields(args, allowed_fields)
+    query = build_filter(args, filters, date_field)
+    query.update(base_query or {})
+    docs, next_cursor = fetch_page(collection, query, fields, parse_limit(args), parse_after(args), FIELD_ALIASES)
+    return [serialize(doc, fields) for doc in docs], next_cursor
+
+def page_response(items, next_cursor):
+    response = jsonify(items)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+@api.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@api.after_app_request
+def record_request_duration(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        http_request_duration.observe(
+            time.perf_counter() - started, route=route, method=request.method, status=str(response.status_code)
+        )
+    return response
+
+# Registered after the timer so it runs first and its cost is in the timing
+@api.after_app_request
+def compress_response(response):
+    return compress(response, current_app.config["COMPRESS_MIN_SIZE"])
+
+@api.app_errorhandler(HasherBusy)
+def password_hasher_busy(e):
+    return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+
+def upgrade_password_hash(collection, user, password):
+    """Re-hash with the current BCRYPT_LOG_ROUNDS after a successful login."""
+    if not passwords.needs_rehash(user["password"]):
+        return
+    # Only replace the hash we verified, in case the password changed meanwhile
+    collection.update_one({"_id": user["_id"], "password": user["password"]}, {"$set": {"password": passwords.hash(password)}})
+
+@api.route("/register", methods=["POST"])
 def register():
     data = request.json
     email = data.get("email")
@@ -47,8 +187,11 @@ def register():
         if existing_user:
             return jsonify({"error": "Email already exists"}), 400
 
-        hashed_password = bcrypt.generate_password_hash(password).decode("utf-8")
-        organizations_id = organizations.insert_one({"email": email, "password": hashed_password, "Details": "No"}).inserted_id
+        hashed_password = passwords.hash(password)
+        try:
+            organizations_id = organizations.insert_one({"email": email, "password": hashed_password, "Details": "No"}).inserted_id
+        except DuplicateKeyError:
+            return jsonify({"error": "Email already exists"}), 400
 
         return jsonify({"message": "Registration successful", "organizations_id": str(organizations_id)}), 201
 
@@ -57,12 +200,15 @@ def register():
         if existing_user:
             return jsonify({"error": "Email already exists"}), 400
 
-        hashed_password = bcrypt.generate_password_hash(password).decode("utf-8")
-        donor_id = donors.insert_one({"email": email, "password": hashed_password, "Details": "No"}).inserted_id
+        hashed_password = passwords.hash(password)
+        try:
+            donor_id = donors.insert_one({"email": email, "password": hashed_password, "Details": "No"}).inserted_id
+        except DuplicateKeyError:
+            return jsonify({"error": "Email already exists"}), 400
 
         return jsonify({"message": "Registration successful", "donor_id": str(donor_id)}), 201
 
-@app.route("/login", methods=["POST"])
+@api.route("/login", methods=["POST"])
 def login():
     data = request.json
     email = data.get("email")
@@ -71,8 +217,9 @@ def login():
 
     if user_type == "donor":
         donor = donors.find_one({"email": email})
-        if not donor or not bcrypt.check_password_hash(donor["password"], password):
+        if not donor or not password or not passwords.check(donor["password"], password):
             return jsonify({"error": "Invalid email or password"}), 401
+        upgrade_password_hash(donors, donor, password)
 
         session["donor_id"] = str(donor["_id"])
 
@@ -82,20 +229,21 @@ def login():
 
     if user_type != "donor":
         organization = organizations.find_one({"email": email})
-        if not organization or not bcrypt.check_password_hash(organization["password"], password):
+        if not organization or not password or not passwords.check(organization["password"], password):
             return jsonify({"error": "Invalid email or password"}), 401
+        upgrade_password_hash(organizations, organization, password)
         
         session["organizations_id"] = str(organization["_id"])
         if organization["Details"] == "Yes":
             return jsonify({"message": "Login successful", "organizations_id": session["organizations_id"], "Details": "Yes"}), 200
         return jsonify({"message": "Login successful", "organizations_id": session["organizations_id"], "Details": "No"}), 200
 
-@app.route("/logout", methods=["POST"])
+@api.route("/logout", methods=["POST"])
 def logout():
     session.pop("donor_id", None)
     return jsonify({"message": "Logged out successfully"}), 200
 
-@app.route("/donor", methods=["POST"])
+@api.route("/donor", methods=["POST"])
 def get_donor():
     try:
         data = request.json
@@ -111,96 +259,160 @@ def get_donor():
             if field not in data or not data[field]:
                 return jsonify({"error": f"Missing field: {field}"}), 400
 
+        location = parse_location(data.get("location"))
+
         existing_donor = donors_collection.find_one({"donor_id": data["donor_id"]})
         if existing_donor:
-            return jsonify({"error": "Donor profile already exists"}), 400
+            return jsonify({"error": "Donor profile already exists; update it with PATCH /donor"}), 400
 
-        donors_id = donors_collection.insert_one({
+        donor_profile = {
             "full_name": data["full_name"],
             "phone_number": data["phone_number"],
             "address": data["address"],
             "donation_preferences": data["donation_preferences"],
             "donor_id": data["donor_id"] 
-        }).inserted_id
+        }
+        if location:
+            # Copied onto each new donation so organisations can find it nearby
+            donor_profile["location"] = location
+        try:
+            donors_id = donors_collection.insert_one(donor_profile).inserted_id
+        except DuplicateKeyError:
+            return jsonify({"error": "Donor profile already exists"}), 400
     
         donor_i = donors.update_one({"_id": ObjectId(donor_id)}, {"$set": {"Details": "Yes"}})
+        invalidate_donor(data["donor_id"])
+        collection_versions.bump("donors_collection")
 
         return jsonify({"message": "Profile created successfully!", "donor_id": str(donor_id)}), 201
 
+    except InvalidLocation as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+DONOR_PROFILE_FIELDS = ["full_name", "phone_number", "address", "donation_preferences"]
+
+@api.route('/donor', methods=['PATCH'])
+def update_donor():
+    try:
+        data = request.json
+        donor_id = data.get("donor_id")
+        if not donor_id:
+            return jsonify({"error": "Missing field: donor_id"}), 400
+
+        # Only the fields sent change; a null location clears it
+        updates = {field: data[field] for field in DONOR_PROFILE_FIELDS if data.get(field)}
+        cleared = {}
+        if "location" in data:
+            location = parse_location(data.get("location"))
+            if location:
+                updates["location"] = location
+            else:
+                cleared["location"] = ""
+        if not (updates or cleared):
+            return jsonify({"error": "Nothing to update"}), 400
+
+        update = {}
+        if updates:
+            update["$set"] = updates
+        if cleared:
+            update["$unset"] = cleared
+        if not donors_collection.update_one({"donor_id": donor_id}, update).matched_count:
+            return jsonify({"error": "Donor not found"}), 404
+
+        located = 0
+        if updates.get("location"):
+            # Pending donations recorded before the donor had a location become findable nearby
+            located = donations_collection.update_many(
+                {"donor_id": donor_id, "location": None}, {"$set": {"location": updates["location"]}}
+            ).modified_count
+        invalidate_donor(donor_id)
+        collection_versions.bump("donors_collection")
+        if located:
+            collection_versions.bump("donations")
+
+        return jsonify({"message": "Profile updated successfully!", "donor_id": donor_id}), 200
+    except InvalidLocation as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/donationDetails', methods=['GET'])
+@api.route('/donationDetails', methods=['GET'])
+@conditional(collection_versions, "donations")
 def donationDetails():
     try:
         donor_id = request.args.get("donor_id")
         if not donor_id:
             return jsonify({"error": "Donor ID is required"}), 400
 
-        # Fetch all donations for the given donor_id
-        donations = donations_collection.find({"donor_id": donor_id})
-        donation_list = []
-        for donation in donations:
-            donation_list.append({
-                "donor_id": donation["donor_id"],
-                "condition": donation["condition"],
-                "number_items": donation["number_items"],
-                "donation_date": donation["donation_date"],
-                "additional_notes": donation["additional_notes"],
-                "image": donation["image"],
-                "response": donation["response"],
-                "itemname": donation["itemname"]
-            })
-
-        if not donation_list:
+        donation_list, next_cursor = list_page(
+            donations_collection, DONATION_FIELDS,
+            filters=["itemname", "condition"], date_field="donation_date",
+            base_query={"donor_id": donor_id}
+        )
+
+        if not donation_list and not request.args.get("after"):
             return jsonify({"error": "No donations found for the given donor ID"}), 404
 
-        return jsonify(donation_list), 200
+        return page_response(donation_list, next_cursor), 200
+    except InvalidQuery as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/donordetails', methods=['GET'])
+@api.route('/donordetails', methods=['GET'])
 def get_donor_details():
     try:
         data = request.args.get("donor_id")
-        donor = donors_collection.find_one({"donor_id": data})  
 
-        if not donor:
-            return jsonify({"error": "Donor not found"}), 404
+        def load():
+            donor = donors_collection.find_one({"donor_id": data})
+            if not donor:
+                return None
+            return {
+                "full_name": donor["full_name"],
+                "totalDonations": donor.get("total_donations", 0),
+                "itemsDonated": donor.get("items_donated", 0),
+                "lastDonation": donor.get("last_donation"),
+                "impactScore": donor.get("impact_score", 0),
+                "recentDonations": donor.get("recent_donations", []),
+                "address": donor.get("address")
+            }
 
-        donor_data = {
-            "full_name": donor["full_name"],
-            "totalDonations": donor.get("total_donations", 0),
-            "itemsDonated": donor.get("items_donated", 0),
-            "lastDonation": donor.get("last_donation"),
-            "impactScore": donor.get("impact_score", 0),
-            "recentDonations": donor.get("recent_donations", []),
-            "address": donor.get("address")
-        }
+        donor_data = response_cache.get_or_load(f"donordetails:{data}", load)
+        if not donor_data:
+            return jsonify({"error": "Donor not found"}), 404
 
         return jsonify(donor_data)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/donorInfo', methods=['GET'])
+@api.route('/donorInfo', methods=['GET'])
 def get_donor_info():
     try:
         donor_ids = request.args.get("donor_ids")
         if not donor_ids:
             return jsonify({"error": "No donor_ids provided"}), 400
 
-        donor_id_list = donor_ids.split(',')
+        donor_id_list = list(dict.fromkeys(donor_ids.split(',')))
 
-        donors = donors_collection.find({"donor_id": {"$in": donor_id_list}})
+        cached = response_cache.get_many([f"donorinfo:{donor_id}" for donor_id in donor_id_list])
+        found = {key.split(":", 1)[1]: value for key, value in cached.items()}
+        missing = [donor_id for donor_id in donor_id_list if donor_id not in found]
 
-        donor_data_list = []
-        for donor in donors:
-            donor_data = {
-                "donor_id": donor["donor_id"],
-                "full_name": donor["full_name"],
-                "address": donor.get("address", "Address not available")
-            }
-            donor_data_list.append(donor_data)
+        if missing:
+            donors = donors_collection.find({"donor_id": {"$in": missing}}, {"donor_id": 1, "full_name": 1, "address": 1})
+            for donor in donors:
+                donor_data = {
+                    "donor_id": donor["donor_id"],
+                    "full_name": donor["full_name"],
+                    "address": donor.get("address", "Address not available")
+                }
+                response_cache.set(f"donorinfo:{donor['donor_id']}", donor_data)
+                found[donor["donor_id"]] = donor_data
+
+        donor_data_list = [found[donor_id] for donor_id in donor_id_list if donor_id in found]
 
         if not donor_data_list:
             return jsonify({"error": "No donors found"}), 404
@@ -209,7 +421,34 @@ def get_donor_info():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/imageupload', methods=['POST'])
+def analyze_image(image_data):
+    raw = base64.b64decode(image_data)
+    image = Image.open(BytesIO(raw))
+    key = content_id(raw)
+    image_hash = dhash(image)
+
+    image_payload_bytes.observe(len(raw), stage="upload")
+
+    description, match = analysis_cache.get(key, image_hash)
+    if description is not None:
+        return description
+
+    payload, mime_type = prepare_image(image, **analysis_image_options)
+    image_payload_bytes.observe(len(payload), stage="model")
+
+    backend = type(analysis_backend).__name__
+    started = time.perf_counter()
+    try:
+        description = analysis_backend.analyze(payload, mime_type)
+    except Exception:
+        model_call_duration.observe(time.perf_counter() - started, backend=backend, outcome="error")
+        raise
+    model_call_duration.observe(time.perf_counter() - started, backend=backend, outcome="ok")
+
+    analysis_cache.put(key, image_hash, description)
+    return description
+
+@api.route('/imageupload', methods=['POST'])
 def image_upload():
     try:
         data = request.json
@@ -218,191 +457,642 @@ def image_upload():
             return jsonify({"error": "No image data provided"}), 400
 
         image_data = image_data.split(",")[1]
-        image = Image.open(BytesIO(base64.b64decode(image_data)))
-
-        image_filename = f"image_{uuid.uuid4()}.png"
-        image.save(image_filename)
 
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        model = genai.GenerativeModel(model_name="models/gemini-2.0-flash")
-        prompt = """Analyze the given image carefully. Return with exactly four fields:
-1. Type : A short, specific label for the primary subject. Type must be of Cloths, Non-perishable Food, School Supplies, Hygiene Products, Baby Supplies and Books. And if not in these type say Other.
-2. Quantity: How many distinct items are visible? Provide an integer.
-3. Google Image: "Yes" or "No" depending on whether you suspect it is found on Google. 
-4. AI Generated: "Yes" or "No" depending on whether you suspect it was AI-generated.
+        if (data.get("mode") or request.args.get("mode")) == "job":
+            # Reject undecodable images now rather than in the worker
+            Image.open(BytesIO(base64.b64decode(image_data)))
+            job_id = analysis_queue.submit(image_data)
+            return jsonify({"message": "Image queued for analysis", "job_id": job_id}), 202
 
-Start with "Here is the analysis of the image:"""
+        description = analyze_image(image_data)
 
-        response = model.generate_content([image_data, prompt], request_options={"timeout": 600})
+        return jsonify({"message": "Image uploaded successfully!", "description": description}), 201
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "5"}
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        os.remove(image_filename)
+@api.route('/imageupload/jobs/<job_id>', methods=['GET'])
+def image_upload_job(job_id):
+    try:
+        wait = min(float(request.args.get("wait", 0)), 30)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
 
-        return jsonify({"message": "Image uploaded successfully!", "description": response.text}), 201
+    try:
+        job = analysis_queue.wait(job_id, wait) if wait > 0 else analysis_queue.get(job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+
+        job_data = {
+            "job_id": job["_id"],
+            "status": job["status"],
+            "attempts": job["attempts"]
+        }
+        if job["status"] == "done":
+            job_data["description"] = job["result"]
+        if job["status"] == "failed":
+            job_data["error"] = job["error"]
+        return jsonify(job_data), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/donations', methods=['POST'])
+RECENT_DONATIONS = 5
+MAX_BATCH_DONATIONS = 500
+
+class InvalidDonation(ValueError):
+    pass
+
+def parse_donation(data):
+    """Validate a donation payload without touching the database.
+
+    Returns (record, raw image bytes, image dHash); the record already has
+    its _id so it can be referenced before it is inserted.
+    """
+    if not isinstance(data, dict):
+        raise InvalidDonation("Donation must be an object")
+    donor_id = data.get("donor_id")
+    condition = data.get("condition")
+    number_items = data.get("numberOfItems")
+    donation_date = data.get("donation_date")
+    additional_notes = data.get("Additional_Notes")
+    image = data.get("image")
+    response = data.get("apiResponse")
+    itemname = data.get("itemname")
+
+    if not (donor_id and condition and donation_date):
+        raise InvalidDonation("All fields are required")
+
+    try:
+        rollups.donation_month(donation_date)
+    except (TypeError, ValueError):
+        raise InvalidDonation("Invalid donation_date")
+
+    try:
+        number_items = int(number_items or 0)
+    except (TypeError, ValueError):
+        raise InvalidDonation("numberOfItems must be an integer")
+    if number_items < 0:
+        raise InvalidDonation("numberOfItems must not be negative")
+
+    try:
+        location = parse_location(data.get("location"))
+    except InvalidLocation as e:
+        raise InvalidDonation(str(e))
+
+    raw, image_hash = None, None
+    if image:
+        try:
+            raw = decode_image(image)
+            image_hash = dhash(Image.open(BytesIO(raw)))
+        except Exception as e:
+            raise InvalidDonation(f"Invalid image data: {e}")
+
+    donation_record = {
+        "_id": ObjectId(),
+        "donor_id": donor_id,
+        "condition": condition,
+        "number_items": number_items,
+        "donation_date": donation_date,
+        "additional_notes": additional_notes,
+        "image_id": content_id(raw) if raw else None,
+        "reused_photo": False,
+        "reused_from": [],
+        "response": response,
+        "itemname": itemname
+    }
+    if location:
+        donation_record["location"] = location
+    return donation_record, raw, image_hash
+
+def store_donation_image(donation_record, raw, image_hash):
+    images.put(raw)
+    reused_from = find_reused_photo(image_fingerprints, image_hash, donation_record["donor_id"])
+    record_fingerprint(image_fingerprints, donation_record["image_id"], image_hash, donation_record["donor_id"])
+    donation_record["reused_photo"] = bool(reused_from)
+    donation_record["reused_from"] = reused_from
+
+def donor_counters_update(donation_records):
+    recent = sorted(donation_records, key=lambda d: d["donation_date"])[-RECENT_DONATIONS:]
+    return {
+        "$inc": {
+            "total_donations": len(donation_records),
+            "items_donated": sum(d["number_items"] for d in donation_records)
+        },
+        "$max": {"last_donation": recent[-1]["donation_date"]},
+        "$push": {"recent_donations": {
+            "$each": [{
+                "donation_id": str(d["_id"]),
+                "itemname": d["itemname"],
+                "number_items": d["number_items"],
+                "donation_date": d["donation_date"]
+            } for d in recent],
+            "$slice": -RECENT_DONATIONS
+        }}
+    }
+
+def run_transaction(callback):
+    """Call callback(session) inside a transaction when MONGO_TRANSACTIONS is on.
+
+    Transactions need a replica set, so on a standalone server the writes
+    run in order with session=None instead.
+    """
+    if not current_app.config["MONGO_TRANSACTIONS"]:
+        return callback(None)
+    with mongo.cx.start_session() as session:
+        return session.with_transaction(callback)
+
+@api.route('/donations', methods=['POST'])
 def donations():
     try:
-        data = request.json
-        donor_id = data.get("donor_id")
-        condition = data.get("condition")
-        number_items = data.get("numberOfItems")
-        donation_date = data.get("donation_date")
-        additional_notes = data.get("Additional_Notes")
-        image = data.get("image")
-        response = data.get("apiResponse")
-        itemname = data.get("itemname")
-
-        if not (donor_id and condition and donation_date):
-            return jsonify({"error": "All fields are required"}), 400
-
-        existing_donor = donors_collection.find_one({"donor_id": donor_id})
-        if not existing_donor:
+        donation_record, raw, image_hash = parse_donation(request.json)
+        donor_id = donation_record["donor_id"]
+
+        def record(session):
+            existing_donor = donors_collection.find_one({"donor_id": donor_id}, {"_id": 1, "location": 1}, session=session)
+            if not existing_donor:
+                return False
+            if "location" not in donation_record and existing_donor.get("location"):
+                donation_record["location"] = existing_donor["location"]
+            if raw:
+                store_donation_image(donation_record, raw, image_hash)
+            donations_collection.insert_one(donation_record, session=session)
+            rollups.record_donation(
+                donation_rollups, donor_id, donation_record["donation_date"],
+                donation_record["number_items"], donation_record["itemname"], session=session
+            )
+            dashboard.record_pending(counters, [donation_record], 1, session=session)
+            search.record_terms(search_terms, [donation_record], 1, session=session)
+            # Last, so without a transaction a failed write above never inflates the donor's totals
+            donors_collection.update_one({"donor_id": donor_id}, donor_counters_update([donation_record]), session=session)
+            return True
+
+        if not run_transaction(record):
             return jsonify({"error": "Donor not found"}), 404
+        invalidate_donor(donor_id)
+        collection_versions.bump("donations", "donors_collection")
 
-        total_donations = existing_donor.get("total_donations", 0)
-        items_donated = existing_donor.get("items_donated", 0)
-        recent_donations = existing_donor.get("recent_donations", [])
-
-        total_donations += 1
-        items_donated += number_items if number_items else 0
-
-        donors_collection.update_one(
-            {"donor_id": donor_id},
-            {
-                "$set": {
-                    "total_donations": total_donations,
-                    "items_donated": items_donated,
-                    "last_donation": donation_date,
-                    "recent_donations": recent_donations
-                }
-            }
-        )
+        return jsonify({"message": "Donation recorded successfully!", "donation_id": str(donation_record["_id"])}), 201
+    except InvalidDonation as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        donation_record = {
-            "donor_id": donor_id,
-            "condition": condition,
-            "number_items": number_items,
-            "donation_date": donation_date,
-            "additional_notes": additional_notes,
-            "image": image,
-            "response": response,
-            "itemname": itemname
+@api.route('/donations/batch', methods=['POST'])
+def donations_batch():
+    try:
+        data = request.json
+        if not isinstance(data, dict):
+            return jsonify({"error": "Request body must be an object with a donations list"}), 400
+        items = data.get("donations")
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "donations must be a non-empty list"}), 400
+        if len(items) > MAX_BATCH_DONATIONS:
+            return jsonify({"error": f"At most {MAX_BATCH_DONATIONS} donations per batch"}), 400
+
+        parsed, errors = [], []
+        for index, item in enumerate(items):
+            try:
+                parsed.append((index, *parse_donation(item)))
+            except InvalidDonation as e:
+                errors.append({"index": index, "error": str(e)})
+
+        donor_ids = list({donation_record["donor_id"] for _, donation_record, _, _ in parsed})
+        known_donors = {
+            donor["donor_id"]: donor.get("location")
+            for donor in donors_collection.find({"donor_id": {"$in": donor_ids}}, {"donor_id": 1, "location": 1})
         }
-        donation_id = donations_collection.insert_one(donation_record).inserted_id
 
-        return jsonify({"message": "Donation recorded successfully!", "donation_id": str(donation_id)}), 201
+        donation_records, by_donor = [], {}
+        for index, donation_record, raw, image_hash in parsed:
+            if donation_record["donor_id"] not in known_donors:
+                errors.append({"index": index, "error": "Donor not found"})
+                continue
+            if "location" not in donation_record and known_donors[donation_record["donor_id"]]:
+                donation_record["location"] = known_donors[donation_record["donor_id"]]
+            if raw:
+                store_donation_image(donation_record, raw, image_hash)
+            donation_records.append(donation_record)
+            by_donor.setdefault(donation_record["donor_id"], []).append(donation_record)
+
+        if not donation_records:
+            return jsonify({"error": "No valid donations", "errors": errors}), 400
+
+        def record(session):
+            donations_collection.insert_many(donation_records, ordered=True, session=session)
+            donation_rollups.bulk_write([
+                rollups.rollup_update(d["donor_id"], d["donation_date"], d["number_items"], d["itemname"])
+                for d in donation_records
+            ], ordered=False, session=session)
+            dashboard.record_pending(counters, donation_records, 1, session=session)
+            search.record_terms(search_terms, donation_records, 1, session=session)
+            # Donor totals last, as in /donations
+            donors_collection.bulk_write([
+                UpdateOne({"donor_id": donor_id}, donor_counters_update(records))
+                for donor_id, records in by_donor.items()
+            ], ordered=True, session=session)
+
+        run_transaction(record)
+        for donor_id in by_donor:
+            invalidate_donor(donor_id)
+        collection_versions.bump("donations", "donors_collection")
+
+        errors.sort(key=lambda error: error["index"])
+        return jsonify({
+            "message": f"Recorded {len(donation_records)} donations",
+            "donation_ids": [str(d["_id"]) for d in donation_records],
+            "errors": errors
+        }), 201
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/oraganisationDetails', methods=['POST'])
+@api.route('/oraganisationDetails', methods=['POST'])
 def organisationDetails():
     try:
         data = request.json
-        organisation_name = data.get("organizationName")
-        registrationNumber = data.get("registrationNumber")
-        address = data.get("address")
         organizations_id = data.get("organizations_id")
-        headName = data.get("headName")
+        if not organizations_id:
+            return jsonify({"error": "Missing field: organizations_id"}), 400
+
+        # Submitting again updates the stored details; fields left out keep their value
+        organisation = {
+            "organisation_name": data.get("organizationName"),
+            "registrationNumber": data.get("registrationNumber"),
+            "address": data.get("address"),
+            "headName": data.get("headName")
+        }
+        organisation = {field: value for field, value in organisation.items() if value is not None}
+        defaults, cleared = {}, {}
+        if "location" in data:
+            location = parse_location(data.get("location"))
+            if location:
+                organisation["location"] = location
+            else:
+                cleared["location"] = ""
+        if "acceptedCategories" in data:
+            organisation["accepted_categories"] = parse_categories(data.get("acceptedCategories"))
+        else:
+            defaults["accepted_categories"] = []
+        if "pickupRadiusKm" in data:
+            organisation["pickup_radius_km"] = parse_radius(data.get("pickupRadiusKm"))
+        else:
+            defaults["pickup_radius_km"] = DEFAULT_RADIUS_KM
 
         org_i = organizations.update_one({"_id": ObjectId(organizations_id)}, {"$set": {"Details": "Yes"}})
-        
-        org_id = oraganisation_collection.insert_one({
-            "organisation_name": organisation_name,
-            "registrationNumber": registrationNumber,
-            "address": address,
-            "organizations_id": organizations_id,
-            "headName": headName
-        }).inserted_id
-        return jsonify({"message": "Details added successfully!", "org_id": str(org_id)}), 201
+
+        update = {"$set": organisation}
+        if defaults:
+            update["$setOnInsert"] = defaults
+        if cleared:
+            update["$unset"] = cleared
+        try:
+            result = oraganisation_collection.update_one({"organizations_id": organizations_id}, update, upsert=True)
+        except DuplicateKeyError:
+            # Another submit for the same organisation created it first
+            return jsonify({"error": "Organisation details are already being saved"}), 400
+        invalidate_organisation(organizations_id)
+        collection_versions.bump("oraganisation_collection")
+
+        if result.upserted_id:
+            return jsonify({"message": "Details added successfully!", "org_id": str(result.upserted_id)}), 201
+        org_id = oraganisation_collection.find_one({"organizations_id": organizations_id}, {"_id": 1})["_id"]
+        return jsonify({"message": "Details updated successfully!", "org_id": str(org_id)}), 200
+    except (InvalidQuery, InvalidLocation) as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/organisationdetails', methods=['GET'])
+@api.route('/organisationdetails', methods=['GET'])
 def organisationdetials():
     try:
         data = request.args.get("organizations_id")
-        organisation = oraganisation_collection.find_one({"organizations_id": data})  
-
-        if not organisation:
-            return jsonify({"error": "Organisation not found"}), 404
 
-        organisation_data = {
-            "organisation_name": organisation["organisation_name"],
-            "Total_Pickups": organisation.get("Total_Pickups", 0),
-            "Pending_Pickups": organisation.get("Pending Pickups", 0),
-            "Completed_Today": organisation.get("Completed Today", 0),
-        }
+        def load():
+            organisation = oraganisation_collection.find_one({"organizations_id": data})
+            if not organisation:
+                return None
+            return {
+                "organisation_name": organisation["organisation_name"],
+                "Total_Pickups": organisation.get("Total_Pickups", 0),
+                "accepted_categories": organisation.get("accepted_categories") or []
+            }
 
-        return jsonify(organisation_data)
+        organisation_data = response_cache.get_or_load(f"organisationdetails:{data}", load)
+        if not organisation_data:
+            return jsonify({"error": "Organisation not found"}), 404
+        organisation_data = dict(organisation_data)
+        categories = organisation_data.pop("accepted_categories", None)
+
+        # Point reads of counters maintained on every write. The pending count
+        # moves with every donation, so it is cached briefly rather than
+        # invalidated; this organisation's own writes do invalidate it.
+        organisation_counters = response_cache.get_or_load(
+            f"organisationcounters:{data}",
+            lambda: dashboard.organisation_counters(counters, organisation_daily, data, categories),
+            ttl=current_app.config["DASHBOARD_COUNTERS_TTL"]
+        )
+        return jsonify(dict(organisation_data, **organisation_counters))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/organisationPickup', methods=['GET'])
+def pickup_categories(organisation):
+    """The itemname filter for an organisation's pickup list, or None.
+
+    Without an explicit itemname filter, only the requested categories or
+    else the ones the organisation takes.
+    """
+    if request.args.get("itemname"):
+        return None
+    categories = parse_categories(request.args.get("categories")) or organisation.get("accepted_categories")
+    return {"itemname": {"$in": categories}} if categories else None
+
+def nearby_donations(near, organisation):
+    """One page of pending donations within reach of ``near``, best match first.
+
+    Donations without a location follow the ranked ones with no distance.
+    Returns (items, next offset or None).
+    """
+    args = request.args
+    fields = parse_fields(args, PICKUP_FIELDS)
+    query = build_filter(args, ["donor_id", "itemname", "condition"], "donation_date")
+    query.update(pickup_categories(organisation) or {})
+    radius_km = parse_radius(args.get("radius_km"), organisation.get("pickup_radius_km") or DEFAULT_RADIUS_KM)
+    limit, offset = parse_limit(args), parse_offset(args)
+
+    docs = list(donations_collection.aggregate(nearby_pipeline(
+        near, radius_km, query, projection(fields, FIELD_ALIASES), limit + 1, offset,
+        unlocated_from=donations_collection.name
+    )))
+    items = []
+    for doc in docs[:limit]:
+        item = serialize(doc, fields)
+        item["distance_km"] = None if doc.get("unranked") else round(doc["distance"] / 1000, 2)
+        items.append(item)
+    return items, offset + limit if len(docs) > limit else None
+
+@api.route('/organisationPickup', methods=['GET'])
+@conditional(collection_versions, "donations", "oraganisation_collection")
 def organisationPickup():
     try:
         organisation_id = request.args.get("organizations_id")
-        organisationdaonation = donations_collection.find({})
-        donations_list = []
-        for donation in organisationdaonation:
-            donations_list.append({
-                "donor_id": donation["donor_id"],
-                "condition": donation["condition"],
-                "number_items": donation["number_items"],
-                "donation_date": donation["donation_date"],
-                "additional_notes": donation["additional_notes"],
-                "image": donation["image"],
-                "itemname": donation["itemname"]
-            })
-
-        pending_pickups = len(donations_list)
-        org_e = oraganisation_collection.update_one({"_id": ObjectId(organisation_id)}, {"$set": {"Pending Pickups": pending_pickups}})
-        return jsonify(donations_list), 200
+        organisation = oraganisation_collection.find_one(
+            {"organizations_id": organisation_id}, {"location": 1, "accepted_categories": 1, "pickup_radius_km": 1}
+        ) or {}
+        if request.args.get("lat") or request.args.get("lng"):
+            near = point(request.args.get("lat"), request.args.get("lng"))
+        else:
+            near = organisation.get("location")
+
+        if near:
+            donations_list, next_offset = nearby_donations(near, organisation)
+            response = jsonify(donations_list)
+            if next_offset is not None:
+                response.headers["X-Next-Offset"] = str(next_offset)
+        else:
+            # Organisations that have not set a location still get every donation they take
+            donations_list, next_cursor = list_page(
+                donations_collection, PICKUP_FIELDS,
+                filters=["donor_id", "itemname", "condition"], date_field="donation_date",
+                base_query=pickup_categories(organisation)
+            )
+            response = page_response(donations_list, next_cursor)
+        return response, 200
+    except (InvalidQuery, InvalidLocation) as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/acceptRequest', methods=['POST'])
-def accept_request():
+@api.route('/donations/search', methods=['GET'])
+@conditional(collection_versions, "donations")
+def search_donations():
+    """Relevance-ranked pending donations for ``q``, with match counts per category."""
     try:
-        data = request.json
-        donor_id = data.get("donor_id")
-        organisation_id = data.get("organisation_id")
+        args = request.args
+        text = (args.get("q") or "").strip()
+        if not text:
+            return jsonify({"error": "q is required"}), 400
+        if len(text) > search.MAX_QUERY_LENGTH:
+            return jsonify({"error": f"q must be at most {search.MAX_QUERY_LENGTH} characters"}), 400
+        fields = parse_fields(args, PICKUP_FIELDS)
+        query = build_filter(args, ["donor_id", "condition"], "donation_date")
+        categories = parse_categories(args.get("categories") or args.get("itemname"))
+        limit, offset = parse_limit(args), parse_offset(args)
+
+        facets = next(donations_collection.aggregate(search.search_pipeline(
+            text, query, categories, projection(fields, FIELD_ALIASES), limit + 1, offset
+        )))
+        results = []
+        for doc in facets["results"][:limit]:
+            item = serialize(doc, fields)
+            item["score"] = round(doc["score"], 3)
+            results.append(item)
+        response = jsonify({
+            "results": results,
+            "categories": [{"category": facet["_id"], "count": facet["count"]} for facet in facets["categories"]],
+            "total": sum(facet["count"] for facet in facets["categories"])
+        })
+        if len(facets["results"]) > limit:
+            response.headers["X-Next-Offset"] = str(offset + limit)
+        return response, 200
+    except InvalidQuery as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        if not (donor_id and organisation_id):
-            return jsonify({"error": "Donor ID and Organisation ID are required"}), 400
+@api.route('/donations/suggest', methods=['GET'])
+@conditional(collection_versions, "donations")
+def suggest_donations():
+    """Typeahead: complete the last word of ``q`` from what is pending."""
+    try:
+        args = request.args
+        text = (args.get("q") or "")[:search.MAX_QUERY_LENGTH]
+        limit = parse_limit(args, default=search.DEFAULT_SUGGESTIONS, maximum=search.MAX_SUGGESTIONS)
+        return jsonify(search.suggest(search_terms, text, limit)), 200
+    except InvalidQuery as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        request_to_accept = donations_collection.find_one({"donor_id": donor_id})
-        if not request_to_accept:
-            return jsonify({"error": "Request not found"}), 404
-        
-        existing_organisation = oraganisation_collection.find_one({"organizations_id": organisation_id})
-        if not existing_organisation:
-            return jsonify({"error": "Organisation not found"}), 404
-        
-        Total_Pickups = existing_organisation.get("Total_Pickups", 0) + 1
-        org_e = oraganisation_collection.update_one({"_id": ObjectId(organisation_id)}, {"$set": {"Total_Pickups": Total_Pickups}})
-
-        accepted_request = {
-            "donor_id": request_to_accept["donor_id"],
-            "condition": request_to_accept["condition"],
-            "number_items": request_to_accept["number_items"],
-            "donation_date": request_to_accept["donation_date"],
-            "additional_notes": request_to_accept["additional_notes"],
-            "image": request_to_accept["image"],
-            "itemname": request_to_accept["itemname"],
-            "organisation_id": organisation_id,
-            "status": "accepted"
-        }
-        accepted_requests_collection.insert_one(accepted_request)
+MAX_BATCH_RESOLVE = 500
+
+def resolved_record(donation, organisation_id, status):
+    record = {
+        "_id": donation["_id"],
+        "donor_id": donation["donor_id"],
+        "condition": donation["condition"],
+        "number_items": donation["number_items"],
+        "donation_date": donation["donation_date"],
+        "additional_notes": donation["additional_notes"],
+        "itemname": donation["itemname"],
+        "organisation_id": organisation_id,
+        "status": status,
+        "location": donation.get("location"),
+        "resolved_at": datetime.utcnow()
+    }
+    try:
+        record["image_id"] = stored_image_id(donation)
+    except InvalidImage:
+        # A bad image must not hold up the move; keep it inline as it was
+        record["image_id"] = None
+        record["image"] = donation.get("image")
+    return record
+
+# A claim older than this belongs to a request that died mid-move and may be taken over
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+def resolve_donations(queries, organisation_id, status):
+    """Move the pending donation matching each query into accepted/declined.
+
+    Each donation is first claimed by marking it with claimed_by, so two
+    organisations racing for the same donation can never both get it.
+    Every resolved record, image migration included, is built before
+    anything is written to the resolved collection, and the claimed
+    donations are deleted only after the resolved records are inserted.
+    Without a transaction a failure removes whatever part of the batch
+    was inserted and releases the claims, so the donations stay pending.
+    The resolved document keeps the donation's _id, so a request taking
+    over a stale claim finds the records its predecessor already
+    inserted and only finishes that move. Returns the ids that were moved.
+    """
+    resolved_collection = accepted_requests_collection if status == "accepted" else declined_requests_collection
+
+    def move(session):
+        claim_id, now = ObjectId(), datetime.utcnow()
+        unclaimed = {"$or": [{"claimed_by": {"$exists": False}}, {"claimed_at": {"$lt": now - CLAIM_TIMEOUT}}]}
+        claimed, inserted = [], []
+        try:
+            for query in queries:
+                donation = donations_collection.find_one_and_update(
+                    {"$and": [query, unclaimed]}, {"$set": {"claimed_by": claim_id, "claimed_at": now}},
+                    sort=[("_id", 1)], return_document=ReturnDocument.AFTER, session=session
+                )
+                if donation:
+                    claimed.append(donation)
+            if not claimed:
+                return [], []
+            # Left behind by a request that died between inserting and deleting
+            finished = list(resolved_collection.find(
+                {"_id": {"$in": [donation["_id"] for donation in claimed]}}, {"organisation_id": 1}, session=session
+            ))
+            finished_ids = {record["_id"] for record in finished}
+            fresh = [
+                resolved_record(donation, organisation_id, status)
+                for donation in claimed if donation["_id"] not in finished_ids
+            ]
+            try:
+                if fresh:
+                    resolved_collection.insert_many(fresh, ordered=True, session=session)
+            except BulkWriteError as e:
+                inserted = [record["_id"] for record in fresh[:e.details.get("nInserted", 0)]]
+                raise
+        except Exception:
+            if session is None:
+                release_claims(resolved_collection, claim_id, inserted)
+            raise
+
+        donations_collection.delete_many({"claimed_by": claim_id}, session=session)
+        dashboard.record_pending(counters, claimed, -1, session=session)
+        search.record_terms(search_terms, claimed, -1, session=session)
+        resolved_by = {}
+        for record in finished + fresh:
+            resolved_by[record["organisation_id"]] = resolved_by.get(record["organisation_id"], 0) + 1
+        for resolver, count in resolved_by.items():
+            dashboard.record_resolved(organisation_daily, oraganisation_collection, resolver, status, count, session=session)
+        return [donation["_id"] for donation in claimed], list(resolved_by)
+
+    moved, resolvers = run_transaction(move)
+    if moved:
+        collection_versions.bump("donations", resolved_collection.name)
+        if status == "accepted":
+            for resolver in resolvers:
+                invalidate_organisation(resolver)
+    return moved
+
+def release_claims(resolved_collection, claim_id, inserted_ids):
+    """Undo a failed move: drop the resolved records it inserted and unmark its donations."""
+    if inserted_ids:
+        resolved_collection.delete_many({"_id": {"$in": inserted_ids}})
+    donations_collection.update_many({"claimed_by": claim_id}, {"$unset": {"claimed_by": "", "claimed_at": ""}})
+
+def resolve_request(status):
+    data = request.json
+    donation_id = data.get("donation_id")
+    donor_id = data.get("donor_id")
+    organisation_id = data.get("organisation_id")
+
+    if not ((donation_id or donor_id) and organisation_id):
+        return jsonify({"error": "Donation ID and Organisation ID are required"}), 400
 
-        donations_collection.delete_one({"donor_id": donor_id})
+    if donation_id:
+        if not ObjectId.is_valid(donation_id):
+            return jsonify({"error": "Invalid donation ID"}), 400
+        query = {"_id": ObjectId(donation_id)}
+        if donor_id:
+            query["donor_id"] = donor_id
+    else:
+        # Older clients only send donor_id; take that donor's oldest pending donation
+        query = {"donor_id": donor_id}
+
+    if status == "accepted" and not oraganisation_collection.find_one({"organizations_id": organisation_id}, {"_id": 1}):
+        return jsonify({"error": "Organisation not found"}), 404
+
+    moved = resolve_donations([query], organisation_id, status)
+    if not moved:
+        return jsonify({"error": "Request not found"}), 404
+
+    return jsonify({"message": f"Request {status} successfully", "donation_id": str(moved[0])}), 200
+
+def resolve_batch(status):
+    data = request.json
+    donation_ids = data.get("donation_ids")
+    organisation_id = data.get("organisation_id")
+
+    if not (isinstance(donation_ids, list) and donation_ids and organisation_id):
+        return jsonify({"error": "donation_ids and Organisation ID are required"}), 400
+    if len(donation_ids) > MAX_BATCH_RESOLVE:
+        return jsonify({"error": f"At most {MAX_BATCH_RESOLVE} donations per batch"}), 400
+    invalid = [donation_id for donation_id in donation_ids if not ObjectId.is_valid(donation_id)]
+    if invalid:
+        return jsonify({"error": "Invalid donation IDs", "donation_ids": invalid}), 400
+
+    if status == "accepted" and not oraganisation_collection.find_one({"organizations_id": organisation_id}, {"_id": 1}):
+        return jsonify({"error": "Organisation not found"}), 404
+
+    unique_ids = list(dict.fromkeys(donation_ids))
+    moved = {str(donation_id) for donation_id in resolve_donations(
+        [{"_id": ObjectId(donation_id)} for donation_id in unique_ids], organisation_id, status
+    )}
+
+    return jsonify({
+        status: [donation_id for donation_id in unique_ids if donation_id in moved],
+        "not_found": [donation_id for donation_id in unique_ids if donation_id not in moved]
+    }), 200
+
+@api.route('/acceptRequest', methods=['POST'])
+def accept_request():
+    try:
+        return resolve_request("accepted")
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify({"message": "Request accepted successfully"}), 200
+@api.route('/acceptRequest/batch', methods=['POST'])
+def accept_request_batch():
+    try:
+        return resolve_batch("accepted")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/acceptRequestorg', methods=['POST'])
+def valid_pickup_date(value):
+    """Whether ``value`` starts with a real ``YYYY-MM-DD`` date; a time may follow."""
+    if not (isinstance(value, str) and re.match(r"\d{4}-\d{2}-\d{2}", value)):
+        return False
+    try:
+        datetime.strptime(value[:10], "%Y-%m-%d")
+    except ValueError:
+        return False
+    return True
+
+@api.route('/acceptRequestorg', methods=['POST'])
 def accept_requestorg():
     try:
         data = request.json
@@ -413,149 +1103,481 @@ def accept_requestorg():
 
         if not all([donor_id, organisation_id, pickup_date, pickup_time]):
             return jsonify({"error": "Missing required fields"}), 400
+        if not valid_pickup_date(pickup_date):
+            return jsonify({"error": "pickup_date must be YYYY-MM-DD"}), 400
+        if routing.parse_time(pickup_time) is None:
+            return jsonify({"error": "pickup_time must be HH:MM, optionally with AM/PM"}), 400
 
+        donor = donors_collection.find_one({"donor_id": donor_id}, {"location": 1}) or {}
         pickup_request = {
             "donor_id": donor_id,
             "organisation_id": organisation_id,
             "pickup_date": pickup_date,
             "pickup_time": pickup_time,
             "status": "accepted",
+            "location": donor.get("location"),
             "created_at": datetime.utcnow()
         }
         pickup_requests.insert_one(pickup_request)
+        dashboard.record_scheduled(organisation_daily, organisation_id, pickup_date)
+        invalidate_organisation(organisation_id)
 
         return jsonify({"message": "Pickup request accepted successfully"}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/declineRequest', methods=['POST'])
-def decline_request():
+MAX_WINDOW_MINUTES = 24 * 60
+# Routes are planned with an n x n distance matrix per window
+MAX_STOPS = 500
+
+@api.route('/pickupSchedule', methods=['GET'])
+def pickup_schedule():
+    """Plan the day's routes for an organisation's accepted pickups."""
+    organisation_id = request.args.get("organisation_id")
+    pickup_date = request.args.get("date")
+    if not (organisation_id and pickup_date):
+        return jsonify({"error": "organisation_id and date are required"}), 400
+    if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", pickup_date):
+        return jsonify({"error": "date must be YYYY-MM-DD"}), 400
     try:
-        data = request.json
-        donor_id = data.get("donor_id")
-        organisation_id = data.get("organisation_id")
-
-        if not (donor_id and organisation_id):
-            return jsonify({"error": "Donor ID and Organisation ID are required"}), 400
-
-        request_to_decline = donations_collection.find_one({"donor_id": donor_id})
-        if not request_to_decline:
-            return jsonify({"error": "Request not found"}), 404
-
-        declined_request = {
-            "donor_id": request_to_decline["donor_id"],
-            "condition": request_to_decline["condition"],
-            "number_items": request_to_decline["number_items"],
-            "donation_date": request_to_decline["donation_date"],
-            "additional_notes": request_to_decline["additional_notes"],
-            "image": request_to_decline["image"],
-            "itemname": request_to_decline["itemname"],
+        window_minutes = int(request.args.get("window_minutes", 120))
+    except ValueError:
+        return jsonify({"error": "window_minutes must be an integer"}), 400
+    if not 1 <= window_minutes <= MAX_WINDOW_MINUTES:
+        return jsonify({"error": f"window_minutes must be between 1 and {MAX_WINDOW_MINUTES}"}), 400
+
+    try:
+        if request.args.get("lat") or request.args.get("lng"):
+            depot = point(request.args.get("lat"), request.args.get("lng"))
+        else:
+            organisation = oraganisation_collection.find_one({"organizations_id": organisation_id}, {"location": 1}) or {}
+            depot = organisation.get("location")
+
+        # Dates are stored as sent, so match the day and anything with a time after it
+        pickups = list(pickup_requests.find(
+            {"organisation_id": organisation_id, "pickup_date": {"$gte": pickup_date, "$lt": pickup_date + "~"}, "status": "accepted"},
+            {"donor_id": 1, "pickup_date": 1, "pickup_time": 1, "location": 1}
+        ).sort("_id", 1).limit(MAX_STOPS + 1))
+        if len(pickups) > MAX_STOPS:
+            return jsonify({"error": f"At most {MAX_STOPS} pickups can be scheduled per day"}), 400
+
+        # Pickups booked before locations were stored use the donor's current one
+        missing = list({pickup["donor_id"] for pickup in pickups if not pickup.get("location")})
+        if missing:
+            locations = {
+                donor["donor_id"]: donor.get("location")
+                for donor in donors_collection.find({"donor_id": {"$in": missing}}, {"donor_id": 1, "location": 1})
+            }
+            for pickup in pickups:
+                if not pickup.get("location"):
+                    pickup["location"] = locations.get(pickup["donor_id"])
+
+        stops = [{
+            "pickup_id": str(pickup["_id"]),
+            "donor_id": pickup["donor_id"],
+            "pickup_time": pickup.get("pickup_time"),
+            "location": pickup.get("location")
+        } for pickup in pickups]
+        windows, unrouted = routing.schedule(stops, depot["coordinates"] if depot else None, window_minutes)
+
+        return jsonify({
             "organisation_id": organisation_id,
-            "status": "declined"
-        }
-        declined_requests_collection.insert_one(declined_request)
+            "date": pickup_date,
+            "depot": depot,
+            "windows": windows,
+            "unrouted": unrouted,
+            "distance_km": round(sum(window["distance_km"] for window in windows), 3)
+        }), 200
+    except InvalidLocation as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        donations_collection.delete_one({"donor_id": donor_id})
+@api.route('/declineRequest', methods=['POST'])
+def decline_request():
+    try:
+        return resolve_request("declined")
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-        return jsonify({"message": "Request declined successfully"}), 200
+@api.route('/declineRequest/batch', methods=['POST'])
+def decline_request_batch():
+    try:
+        return resolve_batch("declined")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/req_accept', methods=['GET'])
+RESOLVED_FILTERS = ["organisation_id", "donor_id", "status", "itemname"]
+
+def resolved_page(collection):
+    """A page of resolved requests, read from the archive files when archived=true."""
+    args = request.args
+    if args.get("archived") != "true":
+        return list_page(collection, RESOLVED_FIELDS, filters=RESOLVED_FILTERS, date_field="donation_date")
+
+    start, end = parse_range(args.get("resolved_from"), args.get("resolved_to"))
+    fields = parse_fields(args, RESOLVED_FIELDS)
+    query = build_filter(args, RESOLVED_FILTERS, "donation_date")
+    docs, next_cursor = request_archive.page(collection.name, start, end, query, parse_limit(args), parse_after(args))
+    return [serialize(doc, fields) for doc in docs], next_cursor
+
+@api.route('/req_accept', methods=['GET'])
+@conditional(collection_versions, "accepted_requests")
 def get_accepted_requests():
     try:
-        accepted_requests = accepted_requests_collection.find({})
-        accepted_requests_list = []
-        for request in accepted_requests:
-            accepted_requests_list.append({
-                "donor_id": request["donor_id"],
-                "condition": request["condition"],
-                "number_items": request["number_items"],
-                "donation_date": request["donation_date"],
-                "additional_notes": request["additional_notes"],
-                "image": request["image"],
-                "itemname": request["itemname"],
-                "organisation_id": request["organisation_id"],
-                "status": request["status"]
-            })
-
-        return jsonify(accepted_requests_list), 200
+        accepted_requests_list, next_cursor = resolved_page(accepted_requests_collection)
+
+        return page_response(accepted_requests_list, next_cursor), 200
+    except InvalidQuery as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/req_decline', methods=['GET'])
+@api.route('/req_decline', methods=['GET'])
+@conditional(collection_versions, "declined_requests")
 def get_declined_requests():
     try:
-        declined_requests = declined_requests_collection.find({})
-        declined_requests_list = []
-        for request in declined_requests:
-            declined_requests_list.append({
-                "donor_id": request["donor_id"],
-                "condition": request["condition"],
-                "number_items": request["number_items"],
-                "donation_date": request["donation_date"],
-                "additional_notes": request["additional_notes"],
-                "image": request["image"],
-                "itemname": request["itemname"],
-                "organisation_id": request["organisation_id"],
-                "status": request["status"]
-            })
-
-        return jsonify(declined_requests_list), 200
+        declined_requests_list, next_cursor = resolved_page(declined_requests_collection)
+
+        return page_response(declined_requests_list, next_cursor), 200
+    except InvalidQuery as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+EXPORT_BATCH_SIZE = 500
+EXPORTS = {
+    "donations": (donations_collection, DONATION_FIELDS, ["donor_id", "itemname", "condition"]),
+    "accepted_requests": (accepted_requests_collection, RESOLVED_FIELDS, RESOLVED_FILTERS),
+    "declined_requests": (declined_requests_collection, RESOLVED_FIELDS, RESOLVED_FILTERS)
+}
+
+@api.route('/export/<name>', methods=['GET'])
+def export(name):
+    if name not in EXPORTS:
+        return jsonify({"error": "Unknown export"}), 404
+
+    try:
+        collection, allowed_fields, filters = EXPORTS[name]
+        export_format = request.args.get("format", "ndjson")
+        if export_format not in ("ndjson", "json"):
+            raise InvalidQuery("format must be ndjson or json")
+
+        fields = parse_fields(request.args, allowed_fields)
+        if "donation_id" not in fields:
+            # Always present so an interrupted export can resume with after=<last donation_id>
+            fields = ["donation_id"] + fields
+        query = build_filter(request.args, filters, "donation_date")
+        after = parse_after(request.args)
+        if after:
+            query["_id"] = {"$gt": after}
+
+        cursor = collection.find(query, projection(fields, FIELD_ALIASES)).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
+    except InvalidQuery as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/leaderBoard', methods=['GET'])
+    dumps = current_app.json.dumps
+
+    # One document in memory at a time; the driver fetches EXPORT_BATCH_SIZE per round trip
+    def generate_ndjson():
+        for doc in cursor:
+            yield dumps(serialize(doc, fields)) + "\n"
+
+    def generate_json():
+        yield "["
+        separator = ""
+        for doc in cursor:
+            yield separator + dumps(serialize(doc, fields))
+            separator = ","
+        yield "]"
+
+    if export_format == "ndjson":
+        body, mimetype = generate_ndjson(), "application/x-ndjson"
+    else:
+        body, mimetype = generate_json(), "application/json"
+    return Response(stream_with_context(body), mimetype=mimetype, headers={"X-Accel-Buffering": "no"})
+
+@api.route('/leaderBoard', methods=['GET'])
+@conditional(collection_versions, "donors_collection")
 def LeaderBoard():
     try:
-        donors = donors_collection.find({})
+        args = request.args
+        fields = parse_fields(args, LEADERBOARD_FIELDS)
+        top = parse_limit(args, default=50, name="top")
+        offset = parse_offset(args)
+
+        # Walks the (items_donated, _id) index, so the cost depends on top + offset only
+        donors = donors_collection.find({}, projection(fields + ["items_donated"])).sort(LEADERBOARD_SORT).skip(offset).limit(top)
+
         donors_list = []
-        for donor in donors:
-            donors_list.append({
-                "donor_id": donor["donor_id"],
-                "full_name": donor["full_name"],
-                "items_donated": donor.get("items_donated", 0)
-            })
+        previous, rank = None, None
+        for position, donor in enumerate(donors, start=offset + 1):
+            items_donated = donor.get("items_donated", 0)
+            if rank is None and offset:
+                rank = donor_rank(items_donated)
+            elif items_donated != previous:
+                rank = position
+            previous = items_donated
+            entry = serialize(donor, fields)
+            if "items_donated" in entry:
+                entry["items_donated"] = items_donated
+            entry["rank"] = rank
+            donors_list.append(entry)
 
         return jsonify(donors_list), 200
+    except InvalidQuery as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/chart', methods=['GET'])
+def donor_rank(items_donated):
+    # Standard competition ranking: donors with equal counts share a rank
+    return donors_collection.count_documents({"items_donated": {"$gt": items_donated}}) + 1
+
+@api.route('/leaderBoard/rank', methods=['GET'])
+def LeaderBoardRank():
+    try:
+        donor_id = request.args.get("donor_id")
+        if not donor_id:
+            return jsonify({"error": "Donor ID is required"}), 400
+
+        donor = donors_collection.find_one({"donor_id": donor_id}, {"donor_id": 1, "full_name": 1, "items_donated": 1})
+        if not donor:
+            return jsonify({"error": "Donor not found"}), 404
+
+        items_donated = donor.get("items_donated", 0)
+        return jsonify({
+            "donor_id": donor["donor_id"],
+            "full_name": donor["full_name"],
+            "items_donated": items_donated,
+            "rank": donor_rank(items_donated),
+            "total_donors": donors_collection.estimated_document_count()
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@api.route('/chart', methods=['GET'])
 def get_donations():
     donor_id = request.args.get('donor_id')
     if not donor_id:
         return jsonify({"error": "donor_id is required"}), 400
 
-    try:
-        donations = donations_collection.find({"donor_id": donor_id}).sort("donation_date", -1)
-
-        donations_list = []
-        for donation in donations:
-            donation_date = datetime.strptime(donation["donation_date"], "%Y-%m-%dT%H:%M:%S.%fZ")
-            month = donation_date.strftime("%B")
+    start = request.args.get("from")
+    end = request.args.get("to")
+    year = request.args.get("year")
+    if year:
+        if not re.fullmatch(r"\d{4}", year):
+            return jsonify({"error": "year must be YYYY"}), 400
+        start, end = f"{year}-01", f"{year}-12"
+    for bound in (start, end):
+        if bound and not re.fullmatch(r"\d{4}-\d{2}", bound):
+            return jsonify({"error": "from and to must be YYYY-MM"}), 400
 
-            month_exists = False
-            for entry in donations_list:
-                if entry["month"] == month:
-                    entry["items"] += donation["number_items"]
-                    month_exists = True
-                    break
+    try:
+        donations_list = rollups.monthly_totals(donation_rollups, donor_id, start, end, request.args.get("category"))
+        return jsonify(donations_list), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-            if not month_exists:
-                donations_list.append({
-                    "month": month,
-                    "items": donation["number_items"]
-                })
+@api.route('/images/<image_id>', methods=['GET'])
+@api.route('/images/<image_id>/<variant>', methods=['GET'])
+def get_image(image_id, variant="original"):
+    if variant not in ("original", "thumbnail") or not is_image_id(image_id):
+        return jsonify({"error": "Image not found"}), 404
 
-        return jsonify(donations_list), 200
+    try:
+        stored = images.get(image_id, variant)
+        if not stored:
+            return jsonify({"error": "Image not found"}), 404
+
+        data, content_type = stored
+        response = make_response(data)
+        response.headers["Content-Type"] = content_type
+        # Images are content-addressed, so a given URL never changes
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        response.set_etag(f"{image_id}.{variant}")
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@api.cli.command("explain-queries")
+def explain_routes():
+    """Explain each route's query shape and report collection scans."""
+    report = explain_queries(mongo.db)
+    for entry in report:
+        flag = "COLLSCAN" if entry["collection_scan"] else "ok"
+        click.echo(f"{flag:9} {entry['collection']:25} {entry['route']:35} {' <- '.join(entry['stages'])}")
+    if any(entry["collection_scan"] for entry in report):
+        raise SystemExit(1)
+
+@api.cli.command("backfill-rollups")
+def backfill_rollups():
+    """Rebuild the monthly donation rollups from stored donations."""
+    buckets, skipped = rollups.backfill(
+        donation_rollups, donations_collection, accepted_requests_collection, declined_requests_collection,
+        request_archive.records("accepted_requests"), request_archive.records("declined_requests")
+    )
+    click.echo(f"Wrote {buckets} rollups, skipped {skipped} donations with unreadable dates")
+
+@api.cli.command("reconcile-counters")
+def reconcile_counters():
+    """Recompute the organisation dashboard counters from stored requests."""
+    pending, buckets = dashboard.reconcile(
+        counters, organisation_daily, oraganisation_collection,
+        donations_collection, accepted_requests_collection, declined_requests_collection, pickup_requests,
+        request_archive.records("accepted_requests"), request_archive.records("declined_requests")
+    )
+    for organisation in oraganisation_collection.find({}, {"organizations_id": 1}):
+        invalidate_organisation(organisation.get("organizations_id"))
+    click.echo(f"{pending} pending donations, wrote {buckets} daily buckets")
+
+@api.cli.command("rebuild-search-terms")
+def rebuild_search_terms():
+    """Recount the typeahead terms from the pending donations."""
+    terms = search.rebuild(search_terms, donations_collection)
+    collection_versions.bump("donations")
+    click.echo(f"Wrote {terms} search terms")
+
+@api.cli.command("archive-requests")
+@click.option("--older-than-days", type=int, default=None, help="Defaults to ARCHIVE_AFTER_DAYS.")
+def archive_requests(older_than_days):
+    """Move old accepted and declined requests into compressed archive files."""
+    days = older_than_days if older_than_days is not None else current_app.config["ARCHIVE_AFTER_DAYS"]
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    for collection in (accepted_requests_collection, declined_requests_collection):
+        try:
+            moved, files = request_archive.archive(collection, cutoff)
+        except ArchiveBusy as e:
+            raise click.ClickException(str(e))
+        if moved:
+            collection_versions.bump(collection.name)
+        click.echo(f"{collection.name}: archived {moved} requests into {files} files")
+
+@api.cli.command("migrate-images")
+def migrate_images():
+    """Move inline base64 images into the image store."""
+    for collection in (donations_collection, accepted_requests_collection, declined_requests_collection):
+        migrated = 0
+        for doc in collection.find({"image": {"$exists": True}}, {"image": 1, "image_id": 1}):
+            try:
+                image_id = stored_image_id(doc)
+            except InvalidImage as e:
+                click.echo(f"{collection.name} {doc['_id']}: {e}")
+                continue
+            collection.update_one({"_id": doc["_id"]}, {"$set": {"image_id": image_id}, "$unset": {"image": ""}})
+            migrated += 1
+        if migrated:
+            collection_versions.bump(collection.name)
+        click.echo(f"{collection.name}: migrated {migrated} images")
+
+@api.cli.command("backfill-locations")
+def backfill_locations():
+    """Copy each donor's location onto their pending donations that have none."""
+    updated = 0
+    for donor in donors_collection.find({"location": {"$exists": True}}, {"donor_id": 1, "location": 1}):
+        updated += donations_collection.update_many(
+            {"donor_id": donor["donor_id"], "location": {"$exists": False}}, {"$set": {"location": donor["location"]}}
+        ).modified_count
+    if updated:
+        collection_versions.bump("donations")
+    click.echo(f"Set the location of {updated} donations")
+
+@api.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
+@api.route('/healthz', methods=['GET'])
+def liveness():
+    return jsonify({"status": "ok"}), 200
+
+@api.route('/readyz', methods=['GET'])
+def readiness():
+    try:
+        mongo.cx.admin.command("ping")
+        return jsonify({"status": "ready"}), 200
+    except Exception as e:
+        return jsonify({"status": "unavailable", "error": str(e)}), 503
+
+def create_app(config=None):
+    """Build the app and this process's Mongo client, pools and workers.
+
+    Call it once per worker process (after any fork), e.g.
+    ``gunicorn "main:create_app()"``.
+    """
+    global images, passwords, analysis_backend, analysis_cache, analysis_queue, analysis_image_options, response_cache, request_archive
+
+    load_dotenv()
+    app = Flask(__name__)
+    app.config["MONGO_URI"] = os.getenv("MONGO_URI")
+    app.config["SECRET_KEY"] = os.getenv("SECRET_KEY")
+    app.config["BCRYPT_LOG_ROUNDS"] = int(os.getenv("BCRYPT_LOG_ROUNDS", 12))
+    app.config["MONGO_TRANSACTIONS"] = os.getenv("MONGO_TRANSACTIONS", "false").lower() == "true"
+    app.config["MONGO_MAX_POOL_SIZE"] = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+    app.config["MONGO_MIN_POOL_SIZE"] = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+    app.config["MONGO_WAIT_QUEUE_TIMEOUT_MS"] = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000))
+    # Smaller bodies are sent uncompressed; brotli is used when installed
+    app.config["COMPRESS_MIN_SIZE"] = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+    app.config["ARCHIVE_AFTER_DAYS"] = int(os.getenv("ARCHIVE_AFTER_DAYS", 180))
+    app.config["DASHBOARD_COUNTERS_TTL"] = int(os.getenv("DASHBOARD_COUNTERS_TTL", 5))
+    app.config.update(config or {})
+
+    mongo.init_app(
+        app,
+        maxPoolSize=app.config["MONGO_MAX_POOL_SIZE"],
+        minPoolSize=app.config["MONGO_MIN_POOL_SIZE"],
+        waitQueueTimeoutMS=app.config["MONGO_WAIT_QUEUE_TIMEOUT_MS"],
+        event_listeners=[mongo_command_metrics]
+    )
+    CORS(app, expose_headers=["X-Next-Cursor", "X-Next-Offset", "ETag"])
+
+    for collection, error in ensure_indexes(mongo.db):
+        app.logger.warning("Could not create indexes on %s: %s", collection, error)
+
+    images = create_image_store(mongo.db)
+    # The pool sizes and caps below are per process; gunicorn.conf.py
+    # scales their defaults down for multi-worker serving
+    passwords = PasswordHasher(
+        rounds=app.config["BCRYPT_LOG_ROUNDS"],
+        workers=int(os.getenv("PASSWORD_HASH_WORKERS", 0)) or None,
+        max_pending=int(os.getenv("PASSWORD_HASH_MAX_PENDING", 0)) or None
+    )
+    analysis_backend = create_backend()
+    analysis_image_options = {
+        "max_edge": int(os.getenv("ANALYSIS_MAX_EDGE", 1024)),
+        "image_format": os.getenv("ANALYSIS_IMAGE_FORMAT", "JPEG"),
+        "quality": int(os.getenv("ANALYSIS_IMAGE_QUALITY", 85))
+    }
+    analysis_cache = AnalysisCache(
+        max_entries=int(os.getenv("ANALYSIS_CACHE_SIZE", 1024)),
+        ttl=int(os.getenv("ANALYSIS_CACHE_TTL", 24 * 60 * 60))
+    )
+    analysis_queue = AnalysisQueue(
+        analysis_jobs, analyze_image,
+        workers=int(os.getenv("ANALYSIS_WORKERS", 4)),
+        max_pending=int(os.getenv("ANALYSIS_MAX_PENDING", 32)),
+        retries=int(os.getenv("ANALYSIS_RETRIES", 2))
+    )
+
+    # In-process by default; set RESPONSE_CACHE_URL=redis://... so every
+    # worker sees the same entries and invalidations
+    response_cache = create_response_cache(
+        os.getenv("RESPONSE_CACHE_URL"),
+        max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", 4096)),
+        ttl=int(os.getenv("RESPONSE_CACHE_TTL", 60))
+    )
+
+    # Shared storage if several machines serve archived reads
+    request_archive = RequestArchive(os.getenv("ARCHIVE_PATH", "archive"))
+
+    app.register_blueprint(api)
+    return app
+
 if __name__ == "__main__":
     try:
         port = int(os.environ.get("PORT", 8000))
         print(f"Starting app on port {port}...")
-        app.run(host="0.0.0.0", port=port, debug=False)
+        create_app().run(host="0.0.0.0", port=port, debug=False)
     except Exception as e:
         print(f"Failed to start app: {e}")
\ No newline at end of file
@@ -0,0 +1,125 @@
+from datetime import datetime
+
+from pagination import InvalidQuery
+
+DEFAULT_RADIUS_KM = 25
+MAX_RADIUS_KM = 200
+# A donation that has waited AGE_HORIZON_DAYS or longer ranks like one
+# AGE_WEIGHT * radius closer than a brand new one at the same distance
+AGE_HORIZON_DAYS = 14
+AGE_WEIGHT = 0.5
+
+
+class InvalidLocation(ValueError):
+    pass
+
+
+def _coordinate(value, name, bound):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise InvalidLocation(f"{name} must be a number")
+    if not -bound <= value <= bound:
+        raise InvalidLocation(f"{name} must be between -{bound} and {bound}")
+    return value
+
+
+def point(lat, lng):
+    return {"type": "Point", "coordinates": [_coordinate(lng, "longitude", 180), _coordinate(lat, "latitude", 90)]}
+
+
+def parse_location(value):
+    """Read a location from a request body as a GeoJSON point, or None if absent.
+
+    Accepts ``{"lat": .., "lng": ..}`` (or latitude/longitude) and GeoJSON
+    points.
+    """
+    if value is None or value == "":
+        return None
+    if not isinstance(value, dict):
+        raise InvalidLocation("location must be an object with lat and lng")
+    if value.get("type") == "Point":
+        coordinates = value.get("coordinates")
+        if not isinstance(coordinates, (list, tuple)) or len(coordinates) != 2:
+            raise InvalidLocation("location coordinates must be [longitude, latitude]")
+        return point(coordinates[1], coordinates[0])
+    lat = value.get("lat", value.get("latitude"))
+    lng = value.get("lng", value.get("lon", value.get("longitude")))
+    if lat is None or lng is None:
+        raise InvalidLocation("location must have lat and lng")
+    return point(lat, lng)
+
+
+def parse_radius(value, default=DEFAULT_RADIUS_KM):
+    if value is None or value == "":
+        return default
+    try:
+        radius = float(value)
+    except (TypeError, ValueError):
+        raise InvalidQuery("radius_km must be a number")
+    if radius <= 0:
+        raise InvalidQuery("radius_km must be positive")
+    return min(radius, MAX_RADIUS_KM)
+
+
+def parse_categories(value):
+    if isinstance(value, str):
+        value = value.split(",")
+    if not value:
+        return []
+    if not isinstance(value, list):
+        raise InvalidQuery("categories must be a list")
+    return [str(category).strip() for category in value if str(category).strip()]
+
+
+def nearby_pipeline(near, radius_km, query, fields_projection, limit, offset=0, now=None, unlocated_from=None):
+    """Aggregation that returns pending donations around ``near``, best match first.
+
+    $geoNear walks the 2dsphere index on location and applies ``query``
+    while it does, so only donations inside the radius are read. Each
+    result gets ``distance`` (metres) and ``match_score``: distance as a
+    fraction of the radius, minus a bonus for time already spent waiting.
+
+    With ``unlocated_from`` (the donations collection's name), donations
+    matching ``query`` that have no location follow the ranked ones,
+    oldest first and marked ``unranked``, so they are not hidden.
+    """
+    radius_m = radius_km * 1000
+    now = now or datetime.utcnow()
+    pipeline = [
+        {"$geoNear": {
+            "near": near,
+            "key": "location",
+            "distanceField": "distance",
+            "maxDistance": radius_m,
+            "spherical": True,
+            "query": query
+        }},
+        {"$addFields": {"match_score": {"$subtract": [
+            {"$divide": ["$distance", radius_m]},
+            {"$multiply": [AGE_WEIGHT, {"$min": [
+                1,
+                {"$divide": [{"$subtract": [now, {"$toDate": "$_id"}]}, AGE_HORIZON_DAYS * 24 * 60 * 60 * 1000]}
+            ]}]}
+        ]}}},
+        {"$sort": {"match_score": 1, "_id": 1}}
+    ]
+    if unlocated_from:
+        # Neither part can contribute more than the page and everything before it
+        window = offset + limit
+        pipeline += [
+            {"$limit": window},
+            {"$unionWith": {"coll": unlocated_from, "pipeline": [
+                {"$match": dict(query, location=None)},
+                {"$sort": {"_id": 1}},
+                {"$limit": window},
+                {"$addFields": {"distance": None, "match_score": None, "unranked": True}}
+            ]}},
+            # Ranked results have no unranked field, which sorts before true
+            {"$sort": {"unranked": 1, "match_score": 1, "_id": 1}}
+        ]
+    return pipeline + [
+        {"$skip": offset},
+        {"$limit": limit},
+        {"$project": dict(fields_projection, distance=1, match_score=1, unranked=1)}
+    ]
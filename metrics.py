@@ -0,0 +1,170 @@
+import bisect
+import threading
+
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, series in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series["counts"]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', _number(bound)))} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(series['sum'])}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series['count']}")
+        return lines
+
+
+class Registry:
+    """Process-local metrics rendered in the Prometheus text format.
+
+    Each server process keeps its own numbers, so scrape every worker (or
+    sum across them) when running several.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge_collector(self, name, documentation, labelnames, collect):
+        """Register a gauge whose samples come from collect() -> [(label values, value)] at scrape time."""
+        self.collectors.append((name, documentation, tuple(labelnames), collect))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        for name, documentation, labelnames, collect in self.collectors:
+            lines += [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+            for values, value in collect():
+                lines.append(f"{name}{_labels(labelnames, values)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every driver command and counts the documents it returned."""
+
+    def __init__(self, registry):
+        self.duration = registry.histogram(
+            "mongo_command_duration_seconds", "Mongo command round-trip time.", ["collection", "command"]
+        )
+        self.documents = registry.counter(
+            "mongo_documents_returned_total", "Documents returned by Mongo commands.", ["collection", "command"]
+        )
+        self.failures = registry.counter(
+            "mongo_command_failures_total", "Mongo commands that returned an error.", ["collection", "command"]
+        )
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(event):
+        return event.connection_id, event.request_id
+
+    def started(self, event):
+        command = event.command
+        collection = command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = command.get("collection")
+        if not isinstance(collection, str):
+            collection = ""
+        with self.lock:
+            self.pending[self._key(event)] = collection
+
+    def _collection(self, event):
+        with self.lock:
+            return self.pending.pop(self._key(event), "")
+
+    def succeeded(self, event):
+        collection = self._collection(event)
+        self.duration.observe(event.duration_micros / 1e6, collection=collection, command=event.command_name)
+        reply = event.reply
+        cursor = reply.get("cursor")
+        if isinstance(cursor, dict):
+            returned = len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+        elif event.command_name == "findAndModify":
+            returned = 1 if reply.get("value") else 0
+        else:
+            returned = 0
+        if returned:
+            self.documents.inc(returned, collection=collection, command=event.command_name)
+
+    def failed(self, event):
+        collection = self._collection(event)
+        self.duration.observe(event.duration_micros / 1e6, collection=collection, command=event.command_name)
+        self.failures.inc(collection=collection, command=event.command_name)
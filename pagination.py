@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+def parse_limit(args, default=DEFAULT_LIMIT, maximum=MAX_LIMIT, name="limit"):
+    try:
+        limit = int(args.get(name, default))
+    except ValueError:
+        raise InvalidQuery(f"{name} must be an integer")
+    if limit < 1:
+        raise InvalidQuery(f"{name} must be positive")
+    return min(limit, maximum)
+
+
+def parse_offset(args):
+    try:
+        offset = int(args.get("offset", 0))
+    except ValueError:
+        raise InvalidQuery("offset must be an integer")
+    if offset < 0:
+        raise InvalidQuery("offset must not be negative")
+    return offset
+
+
+def parse_after(args):
+    after = args.get("after")
+    if not after:
+        return None
+    try:
+        return ObjectId(after)
+    except (InvalidId, TypeError):
+        raise InvalidQuery("after must be a cursor returned by a previous page")
+
+
+def parse_fields(args, allowed):
+    fields = args.get("fields")
+    if not fields:
+        return list(allowed)
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise InvalidQuery(f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+
+def parse_date_bound(args, name):
+    """Read ``from``/``to`` as ``YYYY-MM-DD`` or a full ISO-8601 timestamp.
+
+    Returns (value, date_only) or (None, False) when absent.
+    """
+    value = args.get(name)
+    if not value:
+        return None, False
+    try:
+        if len(value) == 10:
+            datetime.strptime(value, "%Y-%m-%d")
+            return value, True
+        datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise InvalidQuery(f"{name} must be YYYY-MM-DD or an ISO-8601 timestamp")
+    return value, False
+
+
+def build_filter(args, filters, date_field=None):
+    """Turn the query-string filters a route allows into a Mongo query.
+
+    Dates are stored as ISO-8601 strings, so ``from``/``to`` compare
+    lexicographically and can use an index on ``date_field``. A date-only
+    ``to`` includes that whole day.
+    """
+    query = {}
+    for name in filters:
+        value = args.get(name)
+        if value:
+            query[name] = value
+    if date_field:
+        date_range = {}
+        start, _ = parse_date_bound(args, "from")
+        if start:
+            date_range["$gte"] = start
+        end, date_only = parse_date_bound(args, "to")
+        if end and date_only:
+            next_day = datetime.strptime(end, "%Y-%m-%d") + timedelta(days=1)
+            date_range["$lt"] = next_day.strftime("%Y-%m-%d")
+        elif end:
+            date_range["$lte"] = end
+        if date_range:
+            query[date_field] = date_range
+    return query
+
+
+def projection(fields, aliases=None):
+    aliases = aliases or {}
+    projected = {}
+    for field in fields:
+        for stored in aliases.get(field, [field]):
+            projected[stored] = 1
+    return projected
+
+
+def fetch_page(collection, query, fields, limit, after=None, aliases=None):
+    """Return (docs, next_cursor) for one keyset page ordered by ``_id``."""
+    if after is not None:
+        query = {"$and": [query, {"_id": {"$gt": after}}]} if query else {"_id": {"$gt": after}}
+    cursor = collection.find(query, projection(fields, aliases)).sort("_id", 1).limit(limit + 1)
+    docs = list(cursor)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = str(docs[-1]["_id"])
+    return docs, next_cursor
@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def _hash(password, rounds, submitted_at):
+    started_at = time.time()
+    hashed = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds))
+    return hashed.decode("utf-8"), started_at - submitted_at
+
+
+def _check(hashed, password, submitted_at):
+    started_at = time.time()
+    try:
+        valid = bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+    except ValueError:
+        # Malformed stored hash
+        valid = False
+    return valid, started_at - submitted_at
+
+
+def hash_rounds(hashed):
+    try:
+        return int(hashed.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """Runs bcrypt in a small process pool so request threads only wait on I/O.
+
+    At most ``max_pending`` hashes may be queued or running; callers beyond
+    that wait up to ``acquire_timeout`` seconds and then get HasherBusy.
+    """
+
+    def __init__(self, rounds=12, workers=None, max_pending=None, acquire_timeout=5.0, timeout=30.0):
+        self.rounds = rounds
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending or self.workers * 4
+        self.acquire_timeout = acquire_timeout
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.lock = threading.Lock()
+        self.pool = None
+        self.pool_pid = None
+        self.calls = 0
+        self.rejected = 0
+        self.queue_seconds_total = 0.0
+        self.queue_seconds_max = 0.0
+
+    def _executor(self):
+        with self.lock:
+            # A pool inherited across fork is unusable, so each process builds its own
+            if self.pool is None or self.pool_pid != os.getpid():
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+                self.pool_pid = os.getpid()
+            return self.pool
+
+    def _run(self, fn, *args):
+        if not self.slots.acquire(timeout=self.acquire_timeout):
+            with self.lock:
+                self.rejected += 1
+            raise HasherBusy("Too many password operations in progress")
+        try:
+            result, queued = self._executor().submit(fn, *args, time.time()).result(timeout=self.timeout)
+        finally:
+            self.slots.release()
+        with self.lock:
+            self.calls += 1
+            self.queue_seconds_total += queued
+            self.queue_seconds_max = max(self.queue_seconds_max, queued)
+        return result
+
+    def hash(self, password):
+        return self._run(_hash, password, self.rounds)
+
+    def check(self, hashed, password):
+        return self._run(_check, hashed, password)
+
+    def needs_rehash(self, hashed):
+        return hash_rounds(hashed) != self.rounds
+
+    def stats(self):
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "rejected": self.rejected,
+                "queue_seconds_total": self.queue_seconds_total,
+                "queue_seconds_max": self.queue_seconds_max,
+                "rounds": self.rounds,
+                "workers": self.workers
+            }
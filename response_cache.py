@@ -0,0 +1,135 @@
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class ResponseCache(ABC):
+    """Read-through cache for JSON response bodies, keyed by exact entity ids."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _count(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        value = self._get(key)
+        self._count(value is not None)
+        return value
+
+    def get_many(self, keys):
+        values = self._get_many(keys)
+        with self.lock:
+            self.hits += len(values)
+            self.misses += len(keys) - len(values)
+        return values
+
+    def get_or_load(self, key, load, ttl=None):
+        """Return the cached value for key, or call load() and cache a non-None result."""
+        value = self.get(key)
+        if value is None:
+            value = load()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    @abstractmethod
+    def _get(self, key):
+        pass
+
+    def _get_many(self, keys):
+        values = {}
+        for key in keys:
+            value = self._get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    @abstractmethod
+    def set(self, key, value, ttl=None):
+        """Cache value for ``ttl`` seconds, or the cache's default TTL."""
+
+    @abstractmethod
+    def delete(self, *keys):
+        pass
+
+
+class LRUResponseCache(ResponseCache):
+    """In-process cache; each server process keeps its own copy."""
+
+    def __init__(self, max_entries=4096, ttl=60):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    def _get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + (ttl or self.ttl))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+
+class RedisResponseCache(ResponseCache):
+    """Cache shared by every server process; needs the optional redis package."""
+
+    def __init__(self, url, ttl=60, prefix="bridge:"):
+        super().__init__()
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def _get_many(self, keys):
+        if not keys:
+            return {}
+        values = self.client.mget([self.prefix + key for key in keys])
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value), ex=ttl or self.ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+
+def create_response_cache(url=None, max_entries=4096, ttl=60):
+    if url and url.startswith(("redis://", "rediss://")):
+        return RedisResponseCache(url, ttl=ttl)
+    return LRUResponseCache(max_entries=max_entries, ttl=ttl)
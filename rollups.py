@@ -0,0 +1,105 @@
+import calendar
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from sweep import overwrite_and_sweep
+
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%fZ"
+ROLLUP_KEY = [("donor_id", 1), ("month", 1), ("category", 1)]
+
+
+def donation_month(donation_date):
+    """Return the ``YYYY-MM`` bucket for a stored donation date string."""
+    try:
+        date = datetime.strptime(donation_date, DATE_FORMAT)
+    except ValueError:
+        date = datetime.fromisoformat(donation_date)
+    return date.strftime("%Y-%m")
+
+
+def rollup_key(donor_id, donation_date, category=None):
+    return {"donor_id": donor_id, "month": donation_month(donation_date), "category": category}
+
+
+def rollup_increment(number_items):
+    # updated_at lets backfill() tell live writes from buckets it should drop
+    return {"$inc": {"items": number_items or 0, "donations": 1}, "$set": {"updated_at": datetime.utcnow()}}
+
+
+def rollup_update(donor_id, donation_date, number_items, category=None):
+    return UpdateOne(rollup_key(donor_id, donation_date, category), rollup_increment(number_items), upsert=True)
+
+
+def record_donation(rollups, donor_id, donation_date, number_items, category=None, session=None):
+    rollups.update_one(rollup_key(donor_id, donation_date, category), rollup_increment(number_items), upsert=True, session=session)
+
+
+def monthly_totals(rollups, donor_id, start=None, end=None, category=None):
+    """Sum a donor's rollups per month, newest first.
+
+    ``start``/``end`` are inclusive ``YYYY-MM`` bounds.
+    """
+    query = {"donor_id": donor_id}
+    month_range = {}
+    if start:
+        month_range["$gte"] = start
+    if end:
+        month_range["$lte"] = end
+    if month_range:
+        query["month"] = month_range
+    if category:
+        query["category"] = category
+
+    months = {}
+    for rollup in rollups.find(query, {"_id": 0}).sort("month", -1):
+        entry = months.get(rollup["month"])
+        if entry is None:
+            year, month = rollup["month"].split("-")
+            entry = months[rollup["month"]] = {
+                "month": calendar.month_name[int(month)],
+                "year": int(year),
+                "period": rollup["month"],
+                "items": 0,
+                "donations": 0,
+                "categories": {}
+            }
+        entry["items"] += rollup["items"]
+        entry["donations"] += rollup["donations"]
+        if rollup.get("category"):
+            categories = entry["categories"]
+            categories[rollup["category"]] = categories.get(rollup["category"], 0) + rollup["items"]
+    return list(months.values())
+
+
+def backfill(rollups, *sources):
+    """Rebuild every rollup from the donation documents in ``sources``.
+
+    A source is a collection or any iterable of documents, such as
+    archived requests. Returns (buckets written, donations skipped for an
+    unreadable date). Buckets that a live donation creates or bumps after
+    the scan starts are left alone, but an increment that lands on a
+    bucket between the scan and its overwrite is lost, so run it when
+    traffic is quiet.
+    """
+    started_at = datetime.utcnow()
+    totals = {}
+    skipped = 0
+    for source in sources:
+        if hasattr(source, "find"):
+            source = source.find({}, {"donor_id": 1, "donation_date": 1, "number_items": 1, "itemname": 1})
+        for donation in source:
+            try:
+                month = donation_month(donation["donation_date"])
+            except (KeyError, TypeError, ValueError):
+                skipped += 1
+                continue
+            key = (donation["donor_id"], month, donation.get("itemname"))
+            items, count = totals.get(key, (0, 0))
+            totals[key] = (items + (donation.get("number_items") or 0), count + 1)
+
+    written = overwrite_and_sweep(rollups, (
+        ({"donor_id": donor_id, "month": month, "category": category}, {"items": items, "donations": count})
+        for (donor_id, month, category), (items, count) in totals.items()
+    ), keep={"updated_at": {"$gte": started_at}})
+    return written, skipped
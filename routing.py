@@ -0,0 +1,134 @@
+import re
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def distance_matrix(points):
+    """Great-circle distances in km between every pair of ``[lng, lat]`` points."""
+    radians = np.radians(np.asarray(points, dtype=float).reshape(-1, 2))
+    lng, lat = radians[:, 0], radians[:, 1]
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def nearest_neighbour(dist, start=0):
+    """Greedy tour through every node, starting at ``start``."""
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    tour = [start]
+    visited[start] = True
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, dist[tour[-1]])
+        nxt = int(np.argmin(row))
+        tour.append(nxt)
+        visited[nxt] = True
+    return np.array(tour)
+
+
+def two_opt(tour, dist, max_passes=50):
+    """Improve a closed tour by reversing segments while that shortens it.
+
+    The first node stays in place. Each step scores every reversal
+    starting at one position with a single vectorised expression and
+    applies the best.
+    """
+    tour = tour.copy()
+    n = len(tour)
+    if n < 4:
+        return tour
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 1):
+            a, b = tour[i - 1], tour[i]
+            j = np.arange(i + 1, n)
+            c, d = tour[j], tour[(j + 1) % n]
+            delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                tour[i:j[best] + 1] = tour[i:j[best] + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return tour
+
+
+def plan_route(points, depot=None):
+    """Order stops for one vehicle; returns (stop indexes in visiting order, legs in km).
+
+    With a depot the route starts there and the last leg returns to it.
+    Without one it is an open path: a zero-distance dummy node closes
+    the tour, so the optimisation still applies.
+    """
+    n = len(points)
+    if n == 0:
+        return [], []
+    if depot is not None:
+        dist = distance_matrix([depot] + list(points))
+    else:
+        dist = np.zeros((n + 1, n + 1))
+        dist[1:, 1:] = distance_matrix(points)
+    tour = two_opt(nearest_neighbour(dist), dist)
+    stops = [int(node) - 1 for node in tour[1:]]
+    path = [0] + [stop + 1 for stop in stops] + ([0] if depot is not None else [])
+    legs = [float(dist[path[k], path[k + 1]]) for k in range(len(path) - 1)]
+    if depot is None:
+        # The leg from the dummy node is not a real drive
+        legs[0] = 0.0
+    return stops, legs
+
+
+def parse_time(value):
+    """Minutes after midnight for ``HH:MM`` (optionally with AM/PM), or None."""
+    if not isinstance(value, str):
+        return None
+    match = re.fullmatch(r"\s*(\d{1,2}):(\d{2})(?::\d{2})?\s*([AaPp][Mm])?\s*", value)
+    if not match:
+        return None
+    hours, minutes, meridiem = int(match.group(1)), int(match.group(2)), match.group(3)
+    if meridiem:
+        if not 1 <= hours <= 12:
+            return None
+        hours = hours % 12 + (12 if meridiem.lower() == "pm" else 0)
+    if hours > 23 or minutes > 59:
+        return None
+    return hours * 60 + minutes
+
+
+def window_label(start, minutes):
+    end = min(start + minutes, 24 * 60)
+    return f"{start // 60:02d}:{start % 60:02d}-{end // 60:02d}:{end % 60:02d}"
+
+
+def schedule(stops, depot=None, window_minutes=120):
+    """Group stops into pickup-time windows and plan a route for each.
+
+    ``stops`` are dicts with ``location`` (a GeoJSON point or None) and
+    ``pickup_time``. Returns (windows, unrouted): each window has a label,
+    the stops in visiting order with the leg that reaches them, and the
+    route's total length.
+    """
+    groups, unrouted = {}, []
+    for stop in stops:
+        if not stop.get("location"):
+            unrouted.append(dict(stop, reason="No location for this pickup"))
+            continue
+        minute = parse_time(stop.get("pickup_time"))
+        start = None if minute is None else minute - minute % window_minutes
+        groups.setdefault(start, []).append(stop)
+
+    windows = []
+    # Stops with an unreadable time go last, as one "any time" group
+    for start in sorted(groups, key=lambda s: (s is None, s or 0)):
+        group = groups[start]
+        order, legs = plan_route([stop["location"]["coordinates"] for stop in group], depot)
+        planned = [dict(group[index], leg_km=round(leg, 3)) for index, leg in zip(order, legs)]
+        windows.append({
+            "window": "any time" if start is None else window_label(start, window_minutes),
+            "stops": planned,
+            "distance_km": round(sum(legs), 3)
+        })
+    return windows, unrouted
@@ -0,0 +1,119 @@
+import re
+
+from pymongo import UpdateOne
+
+from sweep import overwrite_and_sweep
+
+MAX_QUERY_LENGTH = 200
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 25
+OTHER_CATEGORY = "Other"
+# Weights of the donations text index: the category outranks the model's
+# description, which outranks whatever the donor typed
+TEXT_WEIGHTS = {"itemname": 10, "response": 3, "additional_notes": 1}
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the this to with".split()
+)
+
+
+def terms(text):
+    """Lowercased words of ``text`` worth suggesting, in order."""
+    if not isinstance(text, str):
+        return []
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if len(word) > 1 and word not in STOPWORDS]
+
+
+def donation_type(response):
+    """The ``Type:`` line of the model's analysis, or None."""
+    match = re.search(r"Type\s*:[\s*]*([^\n*]+)", response) if isinstance(response, str) else None
+    return match.group(1).strip() if match else None
+
+
+def donation_terms(doc):
+    """Typeahead terms of a pending donation: its category, model type and notes."""
+    return set(terms(doc.get("itemname")) + terms(donation_type(doc.get("response"))) + terms(doc.get("additional_notes")))
+
+
+def term_counts(docs):
+    counts = {}
+    for doc in docs:
+        for term in donation_terms(doc):
+            counts[term] = counts.get(term, 0) + 1
+    return counts
+
+
+def record_terms(search_terms, docs, delta, session=None):
+    """Add (delta=1) or remove (delta=-1) donations from the typeahead counts."""
+    counts = term_counts(docs)
+    if not counts:
+        return
+    search_terms.bulk_write([
+        UpdateOne({"_id": term}, {"$inc": {"count": delta * count}}, upsert=True)
+        for term, count in counts.items()
+    ], ordered=False, session=session)
+    if delta < 0:
+        # Terms no pending donation uses any more stop being suggested
+        search_terms.delete_many({"_id": {"$in": list(counts)}, "count": {"$lte": 0}}, session=session)
+
+
+def suggest(search_terms, text, limit=DEFAULT_SUGGESTIONS):
+    """Complete the last word of ``text`` from terms of pending donations, most used first.
+
+    Terms are the collection's _id, so an anchored prefix is a range scan
+    over the _id index and never touches the donations themselves.
+    """
+    words = re.findall(r"[a-z0-9]+", (text or "").lower())
+    if not words:
+        return []
+    prefix, leading = words[-1], " ".join(words[:-1])
+    matches = search_terms.find(
+        {"_id": {"$regex": f"^{prefix}"}, "count": {"$gt": 0}}
+    ).sort([("count", -1), ("_id", 1)]).limit(limit)
+    return [{
+        "term": match["_id"],
+        "count": match["count"],
+        "query": f"{leading} {match['_id']}" if leading else match["_id"]
+    } for match in matches]
+
+
+def search_pipeline(text, query, categories, fields_projection, limit, offset=0):
+    """Aggregation for one page of pending donations matching ``text``, best first.
+
+    $text uses the donations text index (stemmed words, "quoted phrases"
+    and -exclusions). One pass returns the page and a count of matches per
+    category; the category filter narrows only the page, so the facet
+    counts still show what choosing another category would return.
+    """
+    page = []
+    if categories:
+        # Donations without an itemname are counted as OTHER_CATEGORY
+        page.append({"$match": {"itemname": {"$in": categories + ([None] if OTHER_CATEGORY in categories else [])}}})
+    page += [
+        {"$sort": {"score": -1, "_id": 1}},
+        {"$skip": offset},
+        {"$limit": limit},
+        {"$project": dict(fields_projection, score=1)}
+    ]
+    return [
+        {"$match": dict(query, **{"$text": {"$search": text}})},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+        {"$facet": {
+            "results": page,
+            "categories": [
+                {"$group": {"_id": {"$ifNull": ["$itemname", OTHER_CATEGORY]}, "count": {"$sum": 1}}},
+                {"$sort": {"count": -1, "_id": 1}}
+            ]
+        }}
+    ]
+
+
+def rebuild(search_terms, donations):
+    """Recount every typeahead term from the pending donations; returns the number of terms.
+
+    Terms no pending donation uses any more are dropped. Counts from
+    donations created or resolved while it runs may be overwritten or
+    dropped, so run it when traffic is quiet.
+    """
+    counts = term_counts(donations.find({}, {"itemname": 1, "response": 1, "additional_notes": 1}))
+    return overwrite_and_sweep(search_terms, (({"_id": term}, {"count": count}) for term, count in counts.items()))
@@ -0,0 +1,25 @@
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+
+def overwrite_and_sweep(collection, documents, keep=None):
+    """Replace the contents of a derived collection without emptying it first.
+
+    ``documents`` yields (filter, fields) pairs. Each is upserted with
+    ``fields`` and a shared ``rebuilt_at`` stamp, then every document the
+    run did not write is deleted, except those matching ``keep``. Readers
+    see the old or the new value of each document but never a gap, and a
+    run that fails before the delete leaves the old documents in place.
+    Returns the number of documents written.
+    """
+    rebuilt_at = datetime.utcnow()
+    writes = [
+        UpdateOne(query, {"$set": dict(fields, rebuilt_at=rebuilt_at)}, upsert=True)
+        for query, fields in documents
+    ]
+    if writes:
+        collection.bulk_write(writes, ordered=False)
+    stale = {"rebuilt_at": {"$ne": rebuilt_at}}
+    collection.delete_many({"$and": [stale, {"$nor": [keep]}]} if keep else stale)
+    return len(writes)